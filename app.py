@@ -1,22 +1,69 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response, stream_with_context
+from flask import Request
 from flask_cors import CORS
 import os
-import pickle
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import pandas as pd
-import PyPDF2
 from datetime import datetime
+import hmac
 import json
+import math
+import time
+import uuid
+import zipfile
+from functools import partial
 from utils.ocr import extract_text_from_image
-from utils.parser import parse_medical_values, validate_values
-from utils.gemini import generate_explanation, get_health_tips
+from utils.pdf_extract import extract_pdf
+from utils.parser import parse_medical_values, parse_lab_panel, validate_values
+from utils.gemini import generate_explanation, get_health_tips, get_default_explanation, initialize_gemini
 from utils.hospital_locator import find_nearest_hospitals, get_google_maps_link
-from utils.chatbot import get_chatbot_response, build_report_context
+from utils.chatbot import (get_chatbot_response, build_report_context, build_prompt_prefix,
+                           build_chat_prompt, summarize_conversation)
+from utils.chat_memory import ChatMemory, estimate_tokens
+from utils.trends import calculate_trends
 from utils.risk_scoring import calculate_risk_score, get_risk_score_message, get_risk_color
+from utils.job_queue import JobQueue, JOB_WORKERS
+from utils.concurrency import run_blocking
+from utils.session_store import ServerSessionInterface
+from utils.admission import admission_controlled, admission_stats, acquire_wait_slot
+from utils.model_registry import ModelRegistry, RISK_LABELS
+from utils.aggregates import PopulationAggregates, CORE_ANALYTES
+from utils.report_store import ReportStore, EXPORT_FORMATS, export_rows, parquet_available
+from utils.imputation import Imputer, SHARED_ACCOUNT_SOURCES
+from utils.profiling import profiled, stage
+from utils.warmup import Warmup, SYNTHETIC_REPORT, synthetic_pdf_path, synthetic_image
+from utils.single_flight import SingleFlight, flight_key
+from utils.uploads import (UploadRejected, UploadStream, REPORT_KINDS, ARCHIVE_KINDS,
+                           save_upload, upload_sha256)
+from utils.bulk import (BulkEntryError, iter_zip_entries, iter_ndjson_entries,
+                        spool_to_tempfile, stream_results)
+
+# Bulk ingestion streams large archives, so it gets its own body size limit
+BULK_MAX_CONTENT_LENGTH = int(os.environ.get('BULK_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+
+class AnalyzerRequest(Request):
+    @property
+    def max_content_length(self):
+        if self.path == '/api/analyze-bulk':
+            return BULK_MAX_CONTENT_LENGTH
+        return super().max_content_length
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Empty file inputs (no file chosen) keep Werkzeug's default handling
+        if not filename:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        
+        # Uploads are hashed, sniffed and written to disk as they stream in
+        if self.path == '/api/analyze-bulk':
+            return UploadStream(app.config['UPLOAD_FOLDER'], ARCHIVE_KINDS)
+        # One bad file in a batch is skipped rather than failing the request
+        skip_rejected = self.path == '/api/analyze-multiple'
+        return UploadStream(app.config['UPLOAD_FOLDER'], REPORT_KINDS, skip_rejected=skip_rejected)
 
 app = Flask(__name__)
+app.request_class = AnalyzerRequest
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
 
 # CORS configuration for frontend
@@ -37,10 +84,11 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['SESSION_COOKIE_SAMESITE'] = 'None'  # Changed from 'None' for localhost
 app.config['SESSION_COOKIE_SECURE'] = True  # Changed to False for localhost
 
-ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'txt'}
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# 'server' keeps session data in SQLite behind a per-worker LRU and only puts a
+# session id in the cookie; 'cookie' uses Flask's signed cookie sessions
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'server')
+if SESSION_BACKEND == 'server':
+    app.session_interface = ServerSessionInterface()
 
 def init_db():
     conn = sqlite3.connect('users.db', timeout=10.0, check_same_thread=False)
@@ -63,15 +111,62 @@ def init_db():
 
 # model = load_ml_model()
 
+# PDF extraction pool processes re-import this module as __mp_main__ when the
+# app is started with `python app.py`; only the app process itself runs the
+# background threads (job workers, flushers, watchers, warm-up)
+IS_APP_PROCESS = __name__ != '__mp_main__'
+
+job_queue = JobQueue()
+
+# Population distributions per analyte for /api/population/*
+population = PopulationAggregates()
+if IS_APP_PROCESS:
+    population.start()
+
+# One row per analyzed report, for /api/reports/export
+report_store = ReportStore()
+
+# Fills analytes missing from a report from the user's recent values
+imputer = Imputer(population)
+
+# /api/jobs/<id>/events streams for at most this long, then the client
+# reconnects (EventSource does so on its own). Keeps a worker thread from being
+# held for long and stays well under gunicorn's worker timeout. A stream that
+# gets no 'job_wait' admission slot (see acquire_wait_slot) sends the current
+# status and ends at once, so the client polls instead.
+JOB_EVENTS_MAX_SECONDS = float(os.environ.get('JOB_EVENTS_MAX_SECONDS', 25))
+JOB_EVENTS_RETRY_MS = 2000
+
+# Longest /api/analyze/explanation/<id>?wait= holds the request, under the
+# same 'job_wait' slot rule
+EXPLANATION_MAX_WAIT_SECONDS = 30.0
+
+# Exporting every user's reports (scope=all) requires this token in X-Admin-Token
+EXPORT_ADMIN_TOKEN = os.environ.get('EXPORT_ADMIN_TOKEN', '')
+
+# Operational endpoints (/api/model, /api/*/stats) need a login or this token
+# in X-Admin-Token (for monitoring); model file paths and the last reload error
+# are only shown with the token
+OPS_ADMIN_TOKEN = os.environ.get('OPS_ADMIN_TOKEN', EXPORT_ADMIN_TOKEN)
+
+def has_admin_token(expected):
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(expected) and hmac.compare_digest(token, expected)
+
+def ops_authorized():
+    return 'user_id' in session or has_admin_token(OPS_ADMIN_TOKEN)
+
+# Return analysis results before the LLM explanation is ready (see
+# /api/analyze/explanation). Clients can also opt in per request.
+DEFER_EXPLANATION = os.environ.get('DEFER_EXPLANATION', '0') == '1'
+
 init_db()
 os.makedirs('uploads', exist_ok=True)
 
-def load_ml_model():
-    with open('model/risk_model.pkl', 'rb') as f:
-        model = pickle.load(f)
-    return model
-
-model = load_ml_model()
+# The risk model is reloaded in the background when model/risk_model.pkl changes
+model_registry = ModelRegistry()
+if IS_APP_PROCESS:
+    model_registry.start()
 
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
@@ -103,6 +198,11 @@ def signup():
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Email already exists'}), 409
 
+def regenerate_session():
+    """Give the session a new id on login and logout (server-side sessions)"""
+    if hasattr(session, 'regenerate'):
+        session.regenerate()
+
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -119,6 +219,7 @@ def login():
     conn.close()
     
     if user and check_password_hash(user[3], password):
+        regenerate_session()
         session['user_id'] = user[0]
         session['user_name'] = user[1]
         session['user_email'] = user[2]
@@ -136,6 +237,7 @@ def login():
 
 @app.route('/api/logout', methods=['POST'])
 def logout():
+    regenerate_session()
     session.clear()
     return jsonify({'message': 'Logged out successfully'}), 200
 
@@ -152,93 +254,210 @@ def get_user():
         }
     }), 200
 
+def extract_report(filepath, filename):
+    """Extract raw text from a saved upload; returns (text, extraction details)"""
+    started = time.perf_counter()
+    
+    if filename.lower().endswith('.pdf'):
+        details = extract_pdf(filepath)
+        details['source'] = 'pdf'
+        return details.pop('text'), details
+    elif filename.lower().endswith('.txt'):
+        with open(filepath, 'r', encoding='utf-8') as txt_file:
+            text = txt_file.read()
+        source = 'text'
+    else:
+        text = extract_text_from_image(filepath)
+        source = 'image'
+    
+    return text, {'source': source, 'seconds': round(time.perf_counter() - started, 4)}
+
+def extract_text_from_upload(filepath, filename):
+    """Extract raw text from a saved upload based on its extension"""
+    return extract_report(filepath, filename)[0]
+
+def predict_risk(values, user_id=None):
+    """
+    Run the ML model on parsed values, imputing missing ones from the user's
+    history (none without a user_id); returns (prediction, imputed values
+    with their source)
+    """
+    ml_values, imputed = imputer.impute(values, user_id)
+    
+    input_data = pd.DataFrame([ml_values])
+    return model_registry.predict(input_data)[0], imputed
+
+def record_report(user_id, values, prediction, risk_score, source, lab_panel=None, imputed=None):
+    """Count a finished analysis in the population aggregates and the exportable history"""
+    population.record(values, prediction, lab_panel)
+    report_store.add(user_id, values, prediction, risk_score, source, imputed=imputed)
+    if source not in SHARED_ACCOUNT_SOURCES:
+        imputer.update(user_id, values)
+
+def build_analysis_result(values, text, defer_explanation=False, user_id=None, source='analyze'):
+    """
+    Predict, score and explain parsed values into the analysis response.
+    
+    With defer_explanation the LLM explanation is queued instead of awaited:
+    the result carries an explanation_id to fetch it from
+    /api/analyze/explanation/<id> once it is ready.
+    """
+    with stage('predict'):
+        prediction, imputed = run_blocking(predict_risk, values, user_id)
+    
+    # Calculate risk score
+    with stage('score'):
+        risk_score = calculate_risk_score(values, prediction)
+        risk_message = get_risk_score_message(risk_score)
+        risk_color = get_risk_color(risk_score)
+        
+        tips = get_health_tips(values, prediction)
+    
+    with stage('lab_panel'):
+        lab_panel = parse_lab_panel(text)
+    
+    record_report(user_id, values, prediction, risk_score, source, lab_panel, imputed)
+    
+    result = {
+        'values': values,
+        'imputed': imputed,
+        'risk_level': str(prediction),
+        'risk_score': risk_score,
+        'risk_message': risk_message,
+        'risk_color': risk_color,
+        'explanation': None,
+        'tips': tips,
+        'lab_panel': lab_panel,
+        'timestamp': datetime.now().isoformat(),
+        'report_text': text[:500]
+    }
+    
+    if defer_explanation:
+        explanation_id = job_queue.submit(
+            'explanation',
+            {'values': values, 'risk_level': str(prediction)},
+            user_id=user_id
+        )
+        result['explanation_status'] = 'pending'
+        result['explanation_id'] = explanation_id
+        result['explanation_url'] = f'/api/analyze/explanation/{explanation_id}'
+        result['explanation_events_url'] = f'/api/jobs/{explanation_id}/events'
+    else:
+        with stage('explanation'):
+            result['explanation'] = generate_explanation(values, prediction)
+        result['explanation_status'] = 'ready'
+    
+    return result
+
+def wants_deferred_explanation():
+    """Per-request opt-in (explanation=deferred), defaulting to DEFER_EXPLANATION"""
+    mode = request.values.get('explanation')
+    if mode == 'deferred':
+        return True
+    if mode == 'inline':
+        return False
+    return DEFER_EXPLANATION
+
+def remember_result(result):
+    """Store an analysis result as the latest report and in the history"""
+    # A retried request that shared the original's result is recorded once
+    last_result = session.get('last_result')
+    if last_result and last_result.get('timestamp') == result['timestamp']:
+        return
+    
+    session['last_result'] = result
+    
+    if 'report_history' not in session:
+        session['report_history'] = []
+    session['report_history'].append(result)
+    session.modified = True
+
+class AnalysisInputError(Exception):
+    pass
+
+def analyze_input(file, text, defer_explanation, user_id):
+    """Extract, parse and analyze one report; returns (result, extraction details or None)"""
+    extraction = None
+    
+    if file is not None:
+        filepath, filename = save_upload(file, app.config['UPLOAD_FOLDER'])
+        
+        try:
+            with stage('extract'):
+                text, extraction = run_blocking(extract_report, filepath, filename)
+        finally:
+            os.remove(filepath)
+        extraction['sha256'] = upload_sha256(file)
+    
+    if not text:
+        raise AnalysisInputError('Could not extract text from the file')
+    
+    with stage('parse'):
+        values = parse_medical_values(text)
+        errors = validate_values(values)
+    
+    if errors:
+        raise AnalysisInputError('Missing or invalid values: ' + ', '.join(errors))
+    
+    result = build_analysis_result(values, text, defer_explanation=defer_explanation, user_id=user_id)
+    return result, extraction
+
+# Retries of a request that is still running wait for it instead of redoing
+# the OCR and LLM work
+analyze_flight = SingleFlight('analyze')
+chatbot_flight = SingleFlight('chatbot')
+
 @app.route('/api/analyze', methods=['POST'])
+@admission_controlled('analyze')
+@profiled('analyze')
 def analyze():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        text = None
+        # Reading the body streams any upload to disk
+        with stage('upload'):
+            file = request.files.get('file')
         
-        if 'file' in request.files and request.files['file'].filename != '':
-            file = request.files['file']
-            
-            if not allowed_file(file.filename):
-                return jsonify({'error': 'Invalid file type. Only PDF, images, and text files are allowed.'}), 400
-            
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            if filename.lower().endswith('.pdf'):
-                with open(filepath, 'rb') as pdf_file:
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    text = ''
-                    for page in pdf_reader.pages:
-                        text += page.extract_text()
-            elif filename.lower().endswith('.txt'):
-                with open(filepath, 'r', encoding='utf-8') as txt_file:
-                    text = txt_file.read()
-            else:
-                text = extract_text_from_image(filepath)
-            
-            os.remove(filepath)
+        if file and file.filename != '':
+            text = None
+            content_hash = upload_sha256(file) or uuid.uuid4().hex
         
         elif 'text' in request.form and request.form['text'].strip():
+            file = None
             text = request.form['text']
+            content_hash = flight_key(text)
         
         else:
             return jsonify({'error': 'No input provided'}), 400
         
-        if not text:
-            return jsonify({'error': 'Could not extract text from the file'}), 400
-        
-        values = parse_medical_values(text)
+        user_id = session['user_id']
+        defer_explanation = wants_deferred_explanation()
+        key = flight_key(user_id, content_hash, defer_explanation)
         
-        errors = validate_values(values)
-        if errors:
-            return jsonify({'error': 'Missing or invalid values: ' + ', '.join(errors)}), 400
-        
-        # Prepare values for ML prediction
-        ml_values = {
-            'hemoglobin': values['hemoglobin'] if values['hemoglobin'] is not None else 14.0,
-            'blood_sugar': values['blood_sugar'] if values['blood_sugar'] is not None else 100.0,
-            'cholesterol': values['cholesterol'] if values['cholesterol'] is not None else 190.0
-        }
-        
-        input_data = pd.DataFrame([ml_values])
-        prediction = model.predict(input_data)[0]
-        
-        # Calculate risk score
-        risk_score = calculate_risk_score(values, prediction)
-        risk_message = get_risk_score_message(risk_score)
-        risk_color = get_risk_color(risk_score)
-        
-        explanation = generate_explanation(values, prediction)
-        tips = get_health_tips(values, prediction)
-        
-        result = {
-            'values': values,
-            'risk_level': prediction,
-            'risk_score': risk_score,
-            'risk_message': risk_message,
-            'risk_color': risk_color,
-            'explanation': explanation,
-            'tips': tips,
-            'timestamp': datetime.now().isoformat(),
-            'report_text': text[:500]
-        }
+        (result, extraction), shared = analyze_flight.do(
+            key, lambda: analyze_input(file, text, defer_explanation, user_id)
+        )
         
-        # Store in session
-        session['last_result'] = result
+        # Store in session and report history
+        with stage('session'):
+            remember_result(result)
         
-        # Also store in report history
-        if 'report_history' not in session:
-            session['report_history'] = []
-        session['report_history'].append(result)
-        session.modified = True
+        if extraction is not None:
+            # Page timings are diagnostic only, so they are not kept in the session
+            response = jsonify(dict(result, extraction=extraction))
+        else:
+            response = jsonify(result)
         
-        return jsonify(result)
+        if shared:
+            response.headers['X-Coalesced'] = '1'
+        return response
+    
+    except AnalysisInputError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    except UploadRejected as e:
+        return jsonify({'error': e.message}), e.status
         
     except Exception as e:
         import traceback
@@ -249,6 +468,381 @@ def analyze():
         print("="*60)
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
+def run_analysis_job(payload):
+    """Job handler: the same pipeline as analyze(), run by a queue worker"""
+    text = payload.get('text')
+    filepath = payload.get('filepath')
+    
+    if filepath:
+        try:
+            text = run_blocking(extract_text_from_upload, filepath, payload['filename'])
+        finally:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+    
+    if not text:
+        raise ValueError('Could not extract text from the file')
+    
+    values = parse_medical_values(text)
+    
+    errors = validate_values(values)
+    if errors:
+        raise ValueError('Missing or invalid values: ' + ', '.join(errors))
+    
+    return build_analysis_result(values, text, user_id=payload.get('user_id'), source='job')
+
+def run_explanation_job(payload):
+    """Job handler: LLM explanation for a result returned before it was ready"""
+    return generate_explanation(payload['values'], payload['risk_level'])
+
+job_queue.register('analysis', run_analysis_job)
+# Explanations finish results the user already has: run them ahead of queued analyses
+job_queue.register('explanation', run_explanation_job, priority=1)
+
+@app.route('/api/jobs', methods=['POST'])
+@admission_controlled('jobs')
+def submit_analysis_job():
+    """Queue an analysis and return a job id without waiting for the result"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        job_id = uuid.uuid4().hex
+        
+        if 'file' in request.files and request.files['file'].filename != '':
+            # Prefix with the job id so concurrent uploads never share a path
+            filepath, filename = save_upload(request.files['file'], app.config['UPLOAD_FOLDER'], prefix=job_id)
+            payload = {'filepath': filepath, 'filename': filename}
+        
+        elif 'text' in request.form and request.form['text'].strip():
+            payload = {'text': request.form['text']}
+        
+        else:
+            return jsonify({'error': 'No input provided'}), 400
+        
+        payload['user_id'] = session['user_id']
+        job_queue.submit('analysis', payload, user_id=session['user_id'], job_id=job_id)
+        
+        # Picked up by collect_finished_jobs however the client learns the result
+        session['pending_jobs'] = session.get('pending_jobs', []) + [job_id]
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}',
+            'events_url': f'/api/jobs/{job_id}/events'
+        }), 202
+    
+    except UploadRejected as e:
+        return jsonify({'error': e.message}), e.status
+        
+    except Exception as e:
+        return jsonify({'error': f'Could not queue analysis: {str(e)}'}), 500
+
+def job_response(job):
+    """Public view of a job; stores finished results in the session"""
+    response = {
+        'job_id': job['id'],
+        'status': job['status']
+    }
+    
+    if job['status'] == 'queued':
+        response['position'] = job['position']
+    elif job['status'] == 'done':
+        result = job['result']
+        response['result'] = result
+        
+        # Record each finished analysis in the report history only once
+        history = session.get('report_history', [])
+        if job['kind'] == 'analysis' and not any(r.get('job_id') == job['id'] for r in history):
+            result['job_id'] = job['id']
+            remember_result(result)
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    
+    if job['status'] in ('done', 'failed') and job['id'] in session.get('pending_jobs', []):
+        session['pending_jobs'] = [j for j in session['pending_jobs'] if j != job['id']]
+    
+    return response
+
+@app.before_request
+def collect_finished_jobs():
+    """
+    Store results of this session's finished analysis jobs in the session.
+    
+    A result delivered over /api/jobs/<id>/events can't be written to the
+    session (it is saved before the stream starts), so it is recorded on the
+    session's next request instead, before the chatbot or percentile lookup
+    reads last_result.
+    """
+    pending = session.get('pending_jobs')
+    if not pending:
+        return
+    
+    for job_id in pending:
+        job = job_queue.get(job_id)
+        if job is None:
+            session['pending_jobs'] = [j for j in session['pending_jobs'] if j != job_id]
+        elif job['status'] in ('done', 'failed'):
+            job_response(job)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    job = job_queue.get(job_id)
+    if job is None or job['user_id'] != session['user_id']:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job_response(job)), 200
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_analysis_job(job_id):
+    """
+    Server-sent events: one event per status change until the job finishes.
+    
+    Each stream lasts at most JOB_EVENTS_MAX_SECONDS (or sends one event and
+    ends when no wait slot is free); the client reconnects after the
+    advertised retry delay and gets the current status again.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    job = job_queue.get(job_id)
+    if job is None or job['user_id'] != user_id:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    release_wait_slot = acquire_wait_slot()
+    max_seconds = JOB_EVENTS_MAX_SECONDS if release_wait_slot else 0
+    
+    def generate():
+        last_status = None
+        deadline = time.time() + max_seconds
+        yield f"retry: {JOB_EVENTS_RETRY_MS}\n\n"
+        
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                break
+            
+            if job['status'] != last_status:
+                last_status = job['status']
+                event = {'job_id': job_id, 'status': job['status']}
+                if job['status'] == 'done':
+                    event['result'] = job['result']
+                elif job['status'] == 'failed':
+                    event['error'] = job['error']
+                yield f"event: {job['status']}\ndata: {json.dumps(event)}\n\n"
+            
+            if job['status'] in ('done', 'failed') or time.time() >= deadline:
+                break
+            
+            time.sleep(0.5)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if release_wait_slot:
+        response.call_on_close(release_wait_slot)
+    return response
+
+@app.route('/api/jobs/stats', methods=['GET'])
+def analysis_job_stats():
+    if not ops_authorized():
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return jsonify(job_queue.stats()), 200
+
+@app.route('/api/analyze/explanation/<explanation_id>', methods=['GET'])
+def get_deferred_explanation(explanation_id):
+    """
+    Fetch an explanation queued by /api/analyze?explanation=deferred.
+    
+    Pass ?wait=<seconds> (up to 30) to hold the request until it is ready;
+    when no wait slot is free (or each worker serves one request at a time)
+    the current status is returned at once.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    job = job_queue.get(explanation_id)
+    if job is None or job['kind'] != 'explanation' or job['user_id'] != session['user_id']:
+        return jsonify({'error': 'Explanation not found'}), 404
+    
+    try:
+        wait_seconds = min(float(request.args.get('wait', 0)), EXPLANATION_MAX_WAIT_SECONDS)
+    except ValueError:
+        wait_seconds = 0
+    
+    if wait_seconds > 0 and job['status'] in ('queued', 'running'):
+        release_wait_slot = acquire_wait_slot()
+        if release_wait_slot:
+            try:
+                deadline = time.time() + wait_seconds
+                while job['status'] in ('queued', 'running') and time.time() < deadline:
+                    time.sleep(0.25)
+                    job = job_queue.get(explanation_id)
+            finally:
+                release_wait_slot()
+    
+    if job['status'] in ('queued', 'running'):
+        return jsonify({'explanation_id': explanation_id, 'status': 'pending'}), 202
+    
+    if job['status'] == 'failed':
+        return jsonify({'explanation_id': explanation_id, 'status': 'failed', 'error': job['error']}), 500
+    
+    explanation = job['result']
+    
+    # Fill the explanation into the stored result so the chatbot and history see it
+    for result in [session.get('last_result')] + session.get('report_history', []):
+        if result and result.get('explanation_id') == explanation_id and result.get('explanation') is None:
+            result['explanation'] = explanation
+            result['explanation_status'] = 'ready'
+            session.modified = True
+    
+    return jsonify({
+        'explanation_id': explanation_id,
+        'status': 'ready',
+        'explanation': explanation
+    }), 200
+
+@app.route('/api/coalescing/stats', methods=['GET'])
+def coalescing_stats():
+    """Requests that ran vs. waited on an identical in-flight request (in this worker or another)"""
+    if not ops_authorized():
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return jsonify({flight.name: flight.stats() for flight in (analyze_flight, chatbot_flight)}), 200
+
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_control_stats():
+    """Per-endpoint load and shedding counters for this worker process"""
+    if not ops_authorized():
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return jsonify(admission_stats()), 200
+
+@app.route('/api/model', methods=['GET'])
+def model_info():
+    """Live model version, reload history and shadow agreement for this worker"""
+    if not ops_authorized():
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    stats = model_registry.stats()
+    if not has_admin_token(OPS_ADMIN_TOKEN):
+        # File paths and error text describe the server, not the model
+        stats.pop('last_error', None)
+        for role in ('live', 'shadow'):
+            if stats.get(role):
+                stats[role].pop('path', None)
+    return jsonify(stats), 200
+
+@app.route('/api/reports/export', methods=['GET'])
+@admission_controlled('export')
+def export_reports():
+    """
+    Stream report history as CSV or Parquet (?format=csv|parquet), optionally
+    limited with since/until (ISO dates). Exports the current user's reports;
+    scope=all exports everyone's and needs the X-Admin-Token header.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format. Use one of: {", ".join(sorted(EXPORT_FORMATS))}'}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet export is not available on this server'}), 501
+    
+    user_id = session['user_id']
+    if request.args.get('scope') == 'all':
+        if not has_admin_token(EXPORT_ADMIN_TOKEN):
+            return jsonify({'error': 'Exporting all reports requires an admin token'}), 403
+        user_id = None
+    
+    since = request.args.get('since')
+    until = request.args.get('until')
+    for bound in (since, until):
+        if bound:
+            try:
+                datetime.fromisoformat(bound)
+            except ValueError:
+                return jsonify({'error': f'Invalid date: {bound}'}), 400
+    
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    chunks = report_store.iter_chunks(user_id, since, until)
+    filename = f'reports-{"all" if user_id is None else user_id}-{datetime.now().strftime("%Y%m%d")}.{extension}'
+    
+    return Response(export_rows(chunks, fmt), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
+
+def population_filters():
+    """Optional risk_level and months query filters; raises ValueError if invalid"""
+    risk_level = request.args.get('risk_level') or None
+    if risk_level is not None and risk_level not in RISK_LABELS:
+        raise ValueError(f'risk_level must be one of: {", ".join(sorted(RISK_LABELS))}')
+    months = request.args.get('months', type=int)
+    if months is not None and not 1 <= months <= 120:
+        raise ValueError('months must be between 1 and 120')
+    return risk_level, months
+
+@app.route('/api/population/percentile', methods=['GET'])
+def population_percentile():
+    """
+    Where a value sits in the population: ?analyte=hemoglobin&value=13.2.
+    Without analyte/value, ranks each core value of the user's latest report.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        risk_level, months = population_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    analyte = request.args.get('analyte')
+    if analyte:
+        value = request.args.get('value', type=float)
+        if value is None or not math.isfinite(value):
+            return jsonify({'error': 'A finite numeric value is required'}), 400
+        try:
+            return jsonify(population.percentile_rank(analyte, value, risk_level, months)), 200
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    result = session.get('last_result')
+    if not result:
+        return jsonify({'error': 'No analysis found. Analyze a report or pass analyte and value.'}), 404
+    
+    return jsonify({
+        'percentiles': [
+            population.percentile_rank(key, result['values'][key], risk_level, months)
+            for key in CORE_ANALYTES if result['values'].get(key) is not None
+        ]
+    }), 200
+
+@app.route('/api/population/summary', methods=['GET'])
+def population_summary():
+    """Population quantiles for one analyte, or the list of analytes with data"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        risk_level, months = population_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    analyte = request.args.get('analyte')
+    if not analyte:
+        return jsonify({'analytes': population.analytes()}), 200
+    
+    try:
+        return jsonify(population.summary(analyte, risk_level, months)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/find-hospitals', methods=['POST'])
 def find_hospitals():
     if 'user_id' not in session:
@@ -270,7 +864,81 @@ def find_hospitals():
     except Exception as e:
         return jsonify({'error': f'Failed to find hospitals: {str(e)}'}), 500
 
+CHAT_MAX_MESSAGE_CHARS = int(os.environ.get('CHAT_MAX_MESSAGE_CHARS', 2000))
+
+chat_memory = ChatMemory()
+
+def get_prompt_prefix():
+    """
+    Instructions plus report context for the chatbot, cached in the session
+    until a new report is analyzed.
+    """
+    result = session.get('last_result')
+    report_key = result.get('timestamp') if result else None
+    
+    cached = session.get('chat_prefix')
+    if cached and cached.get('report') == report_key:
+        return cached['text'], cached['tokens']
+    
+    report_context = None
+    if result:
+        report_context = build_report_context(
+            result.get('values', {}),
+            result.get('risk_level', 'Unknown'),
+            result.get('risk_score', 0)
+        )
+    
+    prefix = build_prompt_prefix(report_context)
+    tokens = estimate_tokens(prefix)
+    session['chat_prefix'] = {'report': report_key, 'text': prefix, 'tokens': tokens}
+    return prefix, tokens
+
+def run_chat_summary_job(payload):
+    """Job handler: fold a user's older chat messages into their summary"""
+    user_id = payload['user_id']
+    summary, messages = chat_memory.messages_to_summarize(user_id)
+    if not messages:
+        return {'summarized': 0}
+    
+    new_summary = summarize_conversation(summary, messages)
+    chat_memory.save_summary(user_id, new_summary, messages[-1]['id'])
+    return {'summarized': len(messages)}
+
+job_queue.register('chat_summary', run_chat_summary_job)
+
+def answer_chat(user_id, user_message, prefix, prefix_tokens):
+    """Answer one chat message with bounded history and record the turn"""
+    summary, recent_messages = chat_memory.load_context(user_id)
+    prompt = build_chat_prompt(user_message, prefix, summary, recent_messages)
+    prompt_tokens = estimate_tokens(prompt)
+    
+    # Get chatbot response
+    started = time.perf_counter()
+    bot_response = get_chatbot_response(user_message, prompt=prompt)
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    
+    chat_memory.record_turn(user_id, user_message, bot_response, prompt_tokens, latency_ms)
+    
+    # Summarize older messages off the request path once enough pile up. One
+    # job per user at a time: turns arriving while it is queued or running
+    # don't start another that would summarize the same messages
+    if chat_memory.messages_to_summarize(user_id)[1]:
+        job_queue.submit_once('chat_summary', {'user_id': user_id}, f'chat_summary-{user_id}', user_id=user_id)
+    
+    return {
+        'response': bot_response,
+        'timestamp': datetime.now().isoformat(),
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'prefix_tokens': prefix_tokens,
+            'summary_tokens': estimate_tokens(summary),
+            'history_messages': len(recent_messages),
+            'latency_ms': latency_ms
+        }
+    }
+
 @app.route('/api/chatbot', methods=['POST'])
+@admission_controlled('chatbot')
 def chatbot():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
@@ -282,34 +950,53 @@ def chatbot():
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
         
-        # Get report context if available
-        report_context = None
-        if 'last_result' in session:
-            result = session['last_result']
-            report_context = build_report_context(
-                result.get('values', {}),
-                result.get('risk_level', 'Unknown'),
-                result.get('risk_score', 0)
-            )
+        if len(user_message) > CHAT_MAX_MESSAGE_CHARS:
+            return jsonify({'error': f'Message is too long (max {CHAT_MAX_MESSAGE_CHARS} characters)'}), 400
         
-        # Get chatbot response
-        bot_response = get_chatbot_response(user_message, report_context)
+        user_id = session['user_id']
         
-        return jsonify({
-            'response': bot_response,
-            'timestamp': datetime.now().isoformat()
-        })
+        # Cached instructions + report context
+        prefix, prefix_tokens = get_prompt_prefix()
+        
+        key = flight_key(user_id, user_message, prefix)
+        reply, shared = chatbot_flight.do(
+            key, lambda: answer_chat(user_id, user_message, prefix, prefix_tokens)
+        )
+        
+        response = jsonify(reply)
+        if shared:
+            response.headers['X-Coalesced'] = '1'
+        return response
         
     except Exception as e:
         return jsonify({'error': f'Chatbot error: {str(e)}'}), 500
 
+@app.route('/api/chatbot/history', methods=['GET'])
+def chatbot_history():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    summary, messages = chat_memory.history(session['user_id'])
+    return jsonify({'summary': summary, 'messages': messages}), 200
+
+@app.route('/api/chatbot/history', methods=['DELETE'])
+def clear_chatbot_history():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    chat_memory.clear(session['user_id'])
+    return jsonify({'message': 'Chat history cleared'}), 200
+
 @app.route('/api/analyze-multiple', methods=['POST'])
+@admission_controlled('analyze_multiple')
+@profiled('analyze_multiple')
 def analyze_multiple():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        files = request.files.getlist('files')
+        with stage('upload'):
+            files = request.files.getlist('files')
         
         if not files or len(files) == 0:
             return jsonify({'error': 'No files provided'}), 400
@@ -318,47 +1005,36 @@ def analyze_multiple():
         
         for file in files:
             if file and file.filename != '':
-                if not allowed_file(file.filename):
+                try:
+                    filepath, filename = save_upload(file, app.config['UPLOAD_FOLDER'])
+                except UploadRejected:
                     continue
                 
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                
                 # Extract text
-                text = ''
-                if filename.lower().endswith('.pdf'):
-                    with open(filepath, 'rb') as pdf_file:
-                        pdf_reader = PyPDF2.PdfReader(pdf_file)
-                        for page in pdf_reader.pages:
-                            text += page.extract_text()
-                elif filename.lower().endswith('.txt'):
-                    with open(filepath, 'r', encoding='utf-8') as txt_file:
-                        text = txt_file.read()
-                else:
-                    text = extract_text_from_image(filepath)
-                
-                os.remove(filepath)
+                try:
+                    with stage('extract'):
+                        text = run_blocking(extract_text_from_upload, filepath, filename)
+                finally:
+                    os.remove(filepath)
                 
                 if text:
-                    values = parse_medical_values(text)
-                    errors = validate_values(values)
+                    with stage('parse'):
+                        values = parse_medical_values(text)
+                        errors = validate_values(values)
                     
                     if not errors:
-                        ml_values = {
-                            'hemoglobin': values['hemoglobin'] if values['hemoglobin'] is not None else 14.0,
-                            'blood_sugar': values['blood_sugar'] if values['blood_sugar'] is not None else 100.0,
-                            'cholesterol': values['cholesterol'] if values['cholesterol'] is not None else 190.0
-                        }
-                        
-                        input_data = pd.DataFrame([ml_values])
-                        prediction = model.predict(input_data)[0]
+                        # Files may be different patients': no history imputation
+                        with stage('predict'):
+                            prediction, imputed = run_blocking(predict_risk, values)
                         risk_score = calculate_risk_score(values, prediction)
+                        record_report(session['user_id'], values, prediction, risk_score, 'multiple',
+                                      imputed=imputed)
                         
                         results.append({
                             'filename': filename,
                             'values': values,
-                            'risk_level': prediction,
+                            'imputed': imputed,
+                            'risk_level': str(prediction),
                             'risk_score': risk_score,
                             'timestamp': datetime.now().isoformat()
                         })
@@ -367,7 +1043,8 @@ def analyze_multiple():
             return jsonify({'error': 'No valid reports could be analyzed'}), 400
         
         # Calculate trends
-        trends = calculate_trends(results)
+        with stage('trends'):
+            trends = calculate_trends(results)
         
         # Store in session
         session['report_history'] = results
@@ -382,58 +1059,167 @@ def analyze_multiple():
     except Exception as e:
         return jsonify({'error': f'Multi-report analysis failed: {str(e)}'}), 500
 
-def calculate_trends(results):
-    """Calculate health trends from multiple reports"""
-    if len(results) < 2:
-        return {'message': 'Need at least 2 reports for trend analysis'}
-    
-    trends = {}
-    
-    # Sort by timestamp
-    sorted_results = sorted(results, key=lambda x: x['timestamp'])
-    first = sorted_results[0]
-    latest = sorted_results[-1]
-    
-    # Hemoglobin trend
-    if first['values'].get('hemoglobin') and latest['values'].get('hemoglobin'):
-        hb_diff = latest['values']['hemoglobin'] - first['values']['hemoglobin']
-        trends['hemoglobin'] = {
-            'change': round(hb_diff, 1),
-            'direction': 'improving' if hb_diff > 0 else 'worsening' if hb_diff < 0 else 'stable',
-            'first': first['values']['hemoglobin'],
-            'latest': latest['values']['hemoglobin']
+def analyze_bulk_entry(name, loader, user_id=None):
+    """Analyze one archive or NDJSON entry into a single NDJSON result line"""
+    try:
+        entry = loader()
+        
+        if 'text' in entry:
+            text = entry['text']
+        else:
+            filename = secure_filename(entry['filename']) or 'report'
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f'{uuid.uuid4().hex}_{filename}')
+            with open(filepath, 'wb') as f:
+                f.write(entry['data'])
+            try:
+                text = run_blocking(extract_text_from_upload, filepath, filename)
+            finally:
+                os.remove(filepath)
+        
+        if not text:
+            raise BulkEntryError('Could not extract text from the file')
+        
+        values = parse_medical_values(text)
+        errors = validate_values(values)
+        if errors:
+            raise BulkEntryError('Missing or invalid values: ' + ', '.join(errors))
+        
+        # A clinic's bulk upload covers many patients: no history imputation
+        prediction, imputed = run_blocking(predict_risk, values)
+        risk_score = calculate_risk_score(values, prediction)
+        record_report(user_id, values, prediction, risk_score, 'bulk', imputed=imputed)
+        
+        return {
+            'name': name,
+            'status': 'ok',
+            'values': values,
+            'imputed': imputed,
+            'risk_level': str(prediction),
+            'risk_score': risk_score,
+            'risk_message': get_risk_score_message(risk_score),
+            'timestamp': datetime.now().isoformat()
         }
     
-    # Blood sugar trend
-    if first['values'].get('blood_sugar') and latest['values'].get('blood_sugar'):
-        bs_diff = latest['values']['blood_sugar'] - first['values']['blood_sugar']
-        trends['blood_sugar'] = {
-            'change': round(bs_diff, 1),
-            'direction': 'worsening' if bs_diff > 0 else 'improving' if bs_diff < 0 else 'stable',
-            'first': first['values']['blood_sugar'],
-            'latest': latest['values']['blood_sugar']
-        }
+    except BulkEntryError as e:
+        return {'name': name, 'status': 'error', 'error': str(e)}
+    except Exception as e:
+        print(f"Bulk entry error ({name}): {str(e)}")
+        return {'name': name, 'status': 'error', 'error': f'Analysis failed: {str(e)}'}
+
+@app.route('/api/analyze-bulk', methods=['POST'])
+@admission_controlled('analyze_bulk')
+def analyze_bulk():
+    """
+    Analyze a ZIP archive of reports or an NDJSON stream of text reports.
     
-    # Cholesterol trend
-    if first['values'].get('cholesterol') and latest['values'].get('cholesterol'):
-        chol_diff = latest['values']['cholesterol'] - first['values']['cholesterol']
-        trends['cholesterol'] = {
-            'change': round(chol_diff, 1),
-            'direction': 'worsening' if chol_diff > 0 else 'improving' if chol_diff < 0 else 'stable',
-            'first': first['values']['cholesterol'],
-            'latest': latest['values']['cholesterol']
-        }
+    Results are streamed back as NDJSON, one line per report in completion
+    order, followed by a summary line. Bulk results are not added to the
+    session report history.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
     
-    # Risk score trend
-    risk_diff = latest['risk_score'] - first['risk_score']
-    trends['overall'] = {
-        'change': risk_diff,
-        'direction': 'worsening' if risk_diff > 0 else 'improving' if risk_diff < 0 else 'stable',
-        'first_score': first['risk_score'],
-        'latest_score': latest['risk_score']
-    }
+    content_type = request.mimetype
+    user_id = session['user_id']
+    
+    try:
+        if content_type in ('application/x-ndjson', 'application/jsonl', 'application/json-seq'):
+            source = None
+            entries = iter_ndjson_entries(request.stream)
+        elif content_type in ('application/zip', 'application/x-zip-compressed'):
+            source = spool_to_tempfile(request.stream)
+            entries = iter_zip_entries(source)
+        elif 'archive' in request.files and request.files['archive'].filename != '':
+            source = request.files['archive'].stream
+            entries = iter_zip_entries(source)
+        else:
+            return jsonify({'error': 'Send a ZIP archive (application/zip or an "archive" upload) or an NDJSON stream (application/x-ndjson)'}), 400
+        
+        if source is not None and not zipfile.is_zipfile(source):
+            source.close()
+            return jsonify({'error': 'Upload is not a valid ZIP archive'}), 400
+    except UploadRejected as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Could not read bulk upload: {str(e)}'}), 400
     
-    return trends
+    def generate():
+        started = time.time()
+        counts = {'ok': 0, 'error': 0}
+        
+        try:
+            for result in stream_results(entries, partial(analyze_bulk_entry, user_id=user_id)):
+                counts[result['status']] += 1
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            yield json.dumps({'status': 'error', 'error': f'Bulk upload aborted: {str(e)}'}) + '\n'
+        finally:
+            if source is not None:
+                source.close()
+        
+        yield json.dumps({'summary': {
+            'total': counts['ok'] + counts['error'],
+            'analyzed': counts['ok'],
+            'failed': counts['error'],
+            'elapsed_seconds': round(time.time() - started, 3)
+        }}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+# Warm-up: push a synthetic report through every stage so the first real
+# request doesn't pay for lazy imports, first-call code paths and client setup
+warmup = Warmup()
+
+@warmup.step('parser')
+def warm_parser():
+    values = parse_medical_values(SYNTHETIC_REPORT)
+    validate_values(values)
+    parse_lab_panel(SYNTHETIC_REPORT)
+
+@warmup.step('model')
+def warm_model():
+    ml_values, _ = imputer.impute({})
+    input_data = pd.DataFrame([ml_values])
+    model_registry.live.model.predict(input_data)
+
+@warmup.step('scoring')
+def warm_scoring():
+    values = parse_medical_values(SYNTHETIC_REPORT)
+    risk_score = calculate_risk_score(values, 'Medium')
+    get_risk_score_message(risk_score)
+    get_health_tips(values, 'Medium')
+    get_default_explanation(values, 'Medium')
+
+@warmup.step('pdf')
+def warm_pdf():
+    filepath = synthetic_pdf_path()
+    try:
+        extract_pdf(filepath)
+    finally:
+        os.remove(filepath)
+
+# Optional: hosts without Tesseract still serve text and PDF reports
+@warmup.step('ocr', required=False)
+def warm_ocr():
+    import pytesseract
+    pytesseract.image_to_string(synthetic_image())
+
+@warmup.step('llm')
+def warm_llm():
+    initialize_gemini()
+
+if IS_APP_PROCESS:
+    # Started only once every job kind is registered above: a job requeued at
+    # startup could otherwise be claimed before its handler exists
+    job_queue.start(JOB_WORKERS)
+    warmup.start()
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until this worker has finished warming up"""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
 
 
 # Initialize database on startup
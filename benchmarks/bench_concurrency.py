@@ -0,0 +1,167 @@
+"""
+Concurrent chatbot benchmark: sync vs threaded vs gevent workers.
+
+Starts gunicorn three times with the same number of worker processes: sync
+(GUNICORN_THREADS=1), gthread (--threads per process) and gevent, with an
+artificial LLM latency (LLM_SIMULATED_LATENCY) standing in for Gemini. It
+then fires --requests concurrent /api/chatbot calls at each and reports
+throughput and latency. The per-user chat rate limit is turned off (every
+request comes from one user) and the admission limits are raised to
+--requests, so the run measures the worker model rather than the shipped
+limits; requests shed anyway (503) are counted separately from failures.
+
+Usage:
+    python benchmarks/bench_concurrency.py [--requests 200] [--workers 2] [--threads 4] [--latency 1.0]
+
+Requires gunicorn and gevent (see requirements.txt). Runs in a temporary
+directory so the users/jobs databases of the checkout are left alone.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def post(url, body, cookie=None):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    if cookie:
+        request.add_header('Cookie', cookie)
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return response.status, response.headers, response.read()
+
+
+def wait_until_up(base_url, deadline=30):
+    started = time.time()
+    while time.time() - started < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/api/health', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def login(base_url):
+    try:
+        post(base_url + '/api/signup', {'name': 'Bench', 'email': 'bench@example.com', 'password': 'bench'})
+    except urllib.error.HTTPError:
+        pass
+    _, headers, _ = post(base_url + '/api/login', {'email': 'bench@example.com', 'password': 'bench'})
+    # The session cookie is marked Secure, so pass it on by hand over plain HTTP
+    return headers['Set-Cookie'].split(';', 1)[0]
+
+
+def fire(base_url, cookie, count):
+    latencies = []
+    errors = []
+    shed = []
+    lock = threading.Lock()
+
+    def one(index):
+        # A distinct message per request: identical in-flight chats would be
+        # coalesced into one LLM call and not measure concurrency at all
+        started = time.perf_counter()
+        try:
+            post(base_url + '/api/chatbot', {'message': f'What does my cholesterol mean? (question {index})'},
+                 cookie)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+        except urllib.error.HTTPError as e:
+            with lock:
+                (shed if e.code == 503 else errors).append(str(e))
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=one, args=(index,)) for index in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] if latencies else 0,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0,
+        'shed': len(shed),
+        'errors': len(errors)
+    }
+
+
+def run_mode(worker_class, threads, args, workdir):
+    port = free_port()
+    env = dict(os.environ,
+               WORKER_CLASS=worker_class,
+               WEB_CONCURRENCY=str(args.workers),
+               WORKER_CONNECTIONS='1000',
+               GUNICORN_THREADS=str(threads),
+               LLM_SIMULATED_LATENCY=str(args.latency),
+               JOB_WORKERS='0',
+               CHATBOT_RATE_PER_MINUTE='0',
+               ADMISSION_CAPACITY=str(args.requests),
+               CHATBOT_MAX_CONCURRENT=str(args.requests),
+               CHATBOT_MAX_QUEUE=str(args.requests),
+               CHATBOT_QUEUE_TIMEOUT='300',
+               PORT=str(port))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(base_url)
+        cookie = login(base_url)
+        return fire(base_url, cookie, args.requests)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per process in gthread mode')
+    parser.add_argument('--latency', type=float, default=1.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-concurrency-')
+    try:
+        for name in ('app.py', 'gunicorn.conf.py'):
+            shutil.copy(os.path.join(ROOT, name), workdir)
+        for name in ('utils', 'model'):
+            shutil.copytree(os.path.join(ROOT, name), os.path.join(workdir, name))
+
+        print(f'{args.requests} concurrent chat requests, {args.workers} worker processes, '
+              f'{args.latency}s simulated LLM latency')
+        print(f"{'worker':>8} {'elapsed s':>10} {'req/s':>8} {'p50 s':>7} {'p99 s':>7} {'shed':>6} {'errors':>7}")
+        for worker_class, threads in (('sync', 1), ('gthread', args.threads), ('gevent', 1)):
+            result = run_mode(worker_class, threads, args, workdir)
+            print(f"{worker_class:>8} {result['elapsed']:>10.2f} {result['throughput']:>8.1f} "
+                  f"{result['p50']:>7.2f} {result['p99']:>7.2f} {result['shed']:>6} {result['errors']:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
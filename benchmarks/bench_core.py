@@ -0,0 +1,264 @@
+"""
+Micro-benchmarks for the analysis core.
+
+Times parse_medical_values, validate_values, calculate_risk_score,
+get_health_tips, get_default_explanation, calculate_trends and model
+prediction on fixed synthetic corpora (seeded, so every run sees the same
+inputs). Runs offline: no API keys, network or server needed.
+
+Usage:
+    python benchmarks/bench_core.py run [--save baseline.json] [--repeat N] [--only NAME ...]
+    python benchmarks/bench_core.py compare baseline.json [--threshold 0.15] [--repeat N]
+
+`compare` re-runs the suite and exits with status 1 if any benchmark's median
+is more than `threshold` (fractional) slower than the baseline. Baselines are
+only meaningful on the machine that recorded them.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import sys
+import time
+import warnings
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+from utils.parser import parse_medical_values, validate_values
+from utils.risk_scoring import calculate_risk_score
+from utils.gemini import get_default_explanation, get_health_tips
+from utils.trends import calculate_trends
+
+CORPUS_SIZE = 200
+SEED = 1234
+RISK_LEVELS = ['Low', 'Medium', 'High']
+
+REPORT_TEMPLATES = [
+    'Hemoglobin: {hb} g/dL\nFasting Blood Sugar: {bs} mg/dL\nTotal Cholesterol: {chol} mg/dL',
+    'CBC\nHb {hb} g/dL\nRBC 4.8 million/uL\nGLUCOSE {bs} mg/dL\nLIPID PROFILE\nCholesterol {chol} mg/dL',
+    'Patient: Test\nHaemoglobin (Hb) {hb}\nRandom glucose: {bs}\nSerum cholesterol - {chol} mg/dl\nComments: none',
+    'HEMOGLOBIN {hb}\nBLOOD SUGAR {bs}\nCHOLESTEROL {chol}'
+]
+
+
+def synthetic_values(rng, missing_rate=0.1):
+    values = {
+        'hemoglobin': round(rng.uniform(8.0, 18.0), 1),
+        'blood_sugar': round(rng.uniform(60.0, 300.0), 1),
+        'cholesterol': round(rng.uniform(120.0, 320.0), 1)
+    }
+    for key in values:
+        if rng.random() < missing_rate:
+            values[key] = None
+    return values
+
+
+def build_corpora(size=CORPUS_SIZE, seed=SEED):
+    rng = random.Random(seed)
+    values = [synthetic_values(rng) for _ in range(size)]
+    complete = [synthetic_values(rng, missing_rate=0) for _ in range(size)]
+    reports = []
+    for item in complete:
+        template = rng.choice(REPORT_TEMPLATES)
+        padding = '\n'.join(f'Note line {i}: sample handled per protocol' for i in range(rng.randint(0, 20)))
+        reports.append(template.format(hb=item['hemoglobin'], bs=item['blood_sugar'],
+                                       chol=item['cholesterol']) + '\n' + padding)
+    levels = [rng.choice(RISK_LEVELS) for _ in range(size)]
+    histories = []
+    for _ in range(size // 10):
+        history = []
+        for month in range(rng.randint(2, 12)):
+            history.append({
+                'values': synthetic_values(rng, missing_rate=0.05),
+                'risk_score': rng.randint(0, 100),
+                'timestamp': f'2024-{month + 1:02d}-01T09:00:00'
+            })
+        rng.shuffle(history)
+        histories.append(history)
+    return {'reports': reports, 'values': values, 'complete': complete, 'levels': levels, 'histories': histories}
+
+
+def load_model():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with open(os.path.join(ROOT, 'model', 'risk_model.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+
+def build_benchmarks(corpora):
+    """name -> (function running one pass over its corpus, number of items in a pass)"""
+    reports = corpora['reports']
+    values = corpora['values']
+    complete = corpora['complete']
+    pairs = list(zip(values, corpora['levels']))
+    histories = corpora['histories']
+    model = load_model()
+    frames = [pd.DataFrame([item]) for item in complete[:50]]
+    batch = pd.DataFrame(complete)
+
+    def parse():
+        for text in reports:
+            parse_medical_values(text)
+
+    def validate():
+        for item in values:
+            validate_values(item)
+
+    def risk_score():
+        for item, level in pairs:
+            calculate_risk_score(item, level)
+
+    def health_tips():
+        for item, level in pairs:
+            get_health_tips(item, level)
+
+    def default_explanation():
+        for item, level in pairs:
+            get_default_explanation(item, level)
+
+    def trends():
+        for history in histories:
+            calculate_trends(history)
+
+    def predict_single():
+        for frame in frames:
+            model.predict(frame)
+
+    def predict_batch():
+        model.predict(batch)
+
+    return {
+        'parse_medical_values': (parse, len(reports)),
+        'validate_values': (validate, len(values)),
+        'calculate_risk_score': (risk_score, len(pairs)),
+        'get_health_tips': (health_tips, len(pairs)),
+        'get_default_explanation': (default_explanation, len(pairs)),
+        'calculate_trends': (trends, len(histories)),
+        'model_predict_single': (predict_single, len(frames)),
+        'model_predict_batch': (predict_batch, len(batch))
+    }
+
+
+def measure(fn, items, repeat, min_seconds=0.05):
+    """Per-item time in microseconds for each of `repeat` passes (each pass is looped to min_seconds)"""
+    fn()
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - started >= min_seconds or loops >= 1000:
+            break
+        loops *= 2
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - started) / loops / items * 1e6)
+    return samples
+
+
+def run_suite(repeat, only=None):
+    benchmarks = build_benchmarks(build_corpora())
+    results = {}
+    for name, (fn, items) in benchmarks.items():
+        if only and name not in only:
+            continue
+        samples = measure(fn, items, repeat)
+        results[name] = {
+            'median_us': round(statistics.median(samples), 3),
+            'min_us': round(min(samples), 3),
+            'stdev_us': round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+            'items': items,
+            'repeat': repeat
+        }
+        print(f"{name:<26} {results[name]['median_us']:>12.2f} {results[name]['min_us']:>12.2f}", flush=True)
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'recorded_at': datetime.now().isoformat(),
+        'corpus_size': CORPUS_SIZE,
+        'seed': SEED
+    }
+
+
+def cmd_run(args):
+    print(f"{'benchmark':<26} {'median us':>12} {'min us':>12}")
+    results = run_suite(args.repeat, args.only)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f'\nSaved baseline to {args.save}')
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    print(f"{'benchmark':<26} {'median us':>12} {'min us':>12}")
+    results = run_suite(args.repeat, args.only)
+
+    print(f"\n{'benchmark':<26} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            print(f"{name:<26} {'-':>12} {current['median_us']:>12.2f} {'new':>8}")
+            continue
+        change = current['median_us'] / previous['median_us'] - 1
+        flag = '  REGRESSION' if change > args.threshold else ''
+        print(f"{name:<26} {previous['median_us']:>12.2f} {current['median_us']:>12.2f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+
+    baseline_env = baseline.get('environment', {})
+    if baseline_env.get('platform') != platform.platform() or baseline_env.get('python') != platform.python_version():
+        print('\nWarning: baseline was recorded on a different platform or Python version')
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f'\nNo regressions over {args.threshold:.0%}')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the suite and optionally save a baseline')
+    run.add_argument('--save', metavar='PATH', help='write results to this baseline JSON')
+
+    compare = commands.add_parser('compare', help='run the suite and compare with a baseline')
+    compare.add_argument('baseline', help='baseline JSON written by "run --save"')
+    compare.add_argument('--threshold', type=float, default=0.15,
+                         help='fractional slowdown of the median that counts as a regression')
+
+    for command in (run, compare):
+        command.add_argument('--repeat', type=int, default=15, help='timed passes per benchmark')
+        command.add_argument('--only', nargs='+', metavar='NAME', help='run only these benchmarks')
+
+    args = parser.parse_args()
+    handler = cmd_run if args.command == 'run' else cmd_compare
+    sys.exit(handler(args))
+
+
+if __name__ == '__main__':
+    main()
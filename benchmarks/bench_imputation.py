@@ -0,0 +1,145 @@
+"""
+Imputation of missing analytes: fixed ML_DEFAULTS vs cohort medians vs the
+user's own history.
+
+Builds seeded synthetic users whose values vary around a personal baseline,
+records their earlier reports, then drops one analyte at a time from each
+user's latest report and imputes it with each strategy. Accuracy is how
+often the model's risk level matches its prediction on the complete report,
+plus the mean absolute error of the imputed value; latency is the time per
+impute call (median and p95). Runs offline against temporary databases.
+
+Usage:
+    python benchmarks/bench_imputation.py [--users N] [--reports N] [--repeat N]
+"""
+import argparse
+import os
+import pickle
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+from utils.aggregates import PopulationAggregates
+from utils.imputation import Imputer
+from utils.model_registry import FEATURES, ML_DEFAULTS
+
+SEED = 1234
+
+BASELINE_RANGES = {
+    'hemoglobin': (9.0, 17.5),
+    'blood_sugar': (70.0, 260.0),
+    'cholesterol': (140.0, 300.0)
+}
+
+# Report-to-report variation around a user's baseline (fraction of the value)
+VARIATION = 0.06
+
+
+def load_model():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with open(os.path.join(ROOT, 'model', 'risk_model.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+
+def build_users(users, reports, seed=SEED):
+    """user_id -> list of complete reports, oldest first"""
+    rng = random.Random(seed)
+    histories = {}
+    for user_id in range(1, users + 1):
+        baseline = {key: rng.uniform(*BASELINE_RANGES[key]) for key in FEATURES}
+        histories[user_id] = [
+            {key: round(value * (1 + rng.gauss(0, VARIATION)), 1) for key, value in baseline.items()}
+            for _ in range(reports)
+        ]
+    return histories
+
+
+def fixed_defaults(values):
+    return {key: values[key] if values[key] is not None else default for key, default in ML_DEFAULTS.items()}
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--reports', type=int, default=6, help='reports per user; the last one is held out')
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes over the held-out reports')
+    args = parser.parse_args()
+
+    model = load_model()
+    histories = build_users(args.users, args.reports)
+
+    with tempfile.TemporaryDirectory() as directory:
+        population = PopulationAggregates(os.path.join(directory, 'aggregates.db'), flush_interval=0)
+        imputer = Imputer(population, db_path=os.path.join(directory, 'imputation.db'))
+        for user_id, reports in histories.items():
+            for report in reports[:-1]:
+                population.record(report, 'Low')
+                imputer.update(user_id, report)
+        population.flush()
+        population.reload()
+
+        strategies = {
+            'fixed defaults': lambda values, user_id: fixed_defaults(values),
+            'cohort median': lambda values, user_id: imputer.impute(values, None)[0],
+            'user history': lambda values, user_id: imputer.impute(values, user_id)[0]
+        }
+
+        cases = []
+        for user_id, reports in histories.items():
+            latest = reports[-1]
+            expected = model.predict(pd.DataFrame([latest]))[0]
+            for missing in FEATURES:
+                cases.append((user_id, missing, latest, dict(latest, **{missing: None}), expected))
+
+        print(f'{len(cases)} reports with one analyte missing '
+              f'({args.users} users, {args.reports - 1} earlier reports each)\n')
+        print(f'{"strategy":<16}{"agreement":>11}{"MAE hb":>9}{"MAE bs":>9}{"MAE chol":>10}'
+              f'{"median us":>11}{"p95 us":>9}')
+
+        for name, strategy in strategies.items():
+            errors = {key: [] for key in FEATURES}
+            filled_cases = []
+            for user_id, missing, latest, values, expected in cases:
+                filled = strategy(values, user_id)
+                errors[missing].append(abs(filled[missing] - latest[missing]))
+                filled_cases.append((filled, expected))
+
+            predictions = model.predict(pd.DataFrame([filled for filled, _ in filled_cases]))
+            agreed = sum(1 for prediction, (_, expected) in zip(predictions, filled_cases) if prediction == expected)
+
+            timings = []
+            for _ in range(args.repeat):
+                for user_id, _, _, values, _ in cases:
+                    started = time.perf_counter()
+                    strategy(values, user_id)
+                    timings.append((time.perf_counter() - started) * 1e6)
+
+            print(f'{name:<16}{agreed / len(cases):>10.1%} '
+                  f'{statistics.mean(errors["hemoglobin"]):>8.2f} '
+                  f'{statistics.mean(errors["blood_sugar"]):>8.1f} '
+                  f'{statistics.mean(errors["cholesterol"]):>9.1f} '
+                  f'{statistics.median(timings):>10.1f} {percentile(timings, 0.95):>8.1f}')
+
+        single = pd.DataFrame([fixed_defaults(cases[0][3])])
+        started = time.perf_counter()
+        for _ in range(20):
+            model.predict(single)
+        print(f'\nFor scale: one model.predict call takes {(time.perf_counter() - started) / 20 * 1e6:.0f} us')
+
+
+if __name__ == '__main__':
+    main()
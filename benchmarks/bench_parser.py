@@ -0,0 +1,103 @@
+"""
+Lab panel parser benchmark.
+
+Compares the keyword automaton used by parse_lab_panel with the previous
+approach of running one regex per alias, on catalogs of 10, 100 and 500
+analytes. The automaton's cost should stay flat as the catalog grows while the
+per-alias regex scan grows linearly.
+
+Usage:
+    python benchmarks/bench_parser.py [--repeat N]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.analytes import ANALYTE_CATALOG
+from utils.parser import build_analyte_matcher, parse_lab_panel
+
+CATALOG_SIZES = [10, 100, 500]
+
+
+def synthetic_catalog(size):
+    """The real catalog, truncated or padded with made-up analytes to `size`"""
+    catalog = list(ANALYTE_CATALOG[:size])
+    index = 0
+    while len(catalog) < size:
+        catalog.append({
+            'key': f'marker_{index}',
+            'name': f'Marker {index}',
+            'panel': 'Synthetic',
+            'unit': 'U/L',
+            'aliases': [f'marker {index}', f'mk{index}', f'serum marker {index}'],
+            'units': {'u/l': 1.0},
+            'valid_range': (0, 1000),
+            'normal_range': (10, 100)
+        })
+        index += 1
+    return catalog
+
+
+def synthetic_report(catalog, lines=10, seed=42):
+    """A report of fixed size mentioning `lines` random analytes from the catalog"""
+    rng = random.Random(seed)
+    body = ['PATIENT LAB REPORT', 'Name: Test Patient    Age: 45    Sex: M', 'Sample collected: 08:30 AM']
+    for analyte in rng.sample(catalog, min(lines, len(catalog))):
+        low, high = analyte['valid_range']
+        value = round(rng.uniform(low, high), 1)
+        alias = rng.choice(analyte['aliases']).title()
+        body.append(f'{alias}: {value} {analyte["unit"]}    (ref range shown on the right)')
+    body.append('Comments: results should be interpreted by a physician.')
+    return '\n'.join(body)
+
+
+def regex_parse(text, compiled):
+    """Previous approach: one regex search per alias"""
+    text_lower = text.lower()
+    found = {}
+    for key, pattern in compiled:
+        if key in found:
+            continue
+        match = pattern.search(text_lower)
+        if match:
+            found[key] = float(match.group(1))
+    return found
+
+
+def time_call(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'analytes':>9} {'aliases':>8} {'automaton us':>13} {'regex us':>10} {'found':>6}")
+    for size in CATALOG_SIZES:
+        catalog = synthetic_catalog(size)
+        matcher = build_analyte_matcher(catalog)
+        compiled = [
+            (analyte['key'], re.compile(re.escape(alias.lower()) + r'[:\s]+(\d+\.?\d*)'))
+            for analyte in catalog for alias in analyte['aliases']
+        ]
+        text = synthetic_report(catalog)
+
+        automaton_us = time_call(lambda: parse_lab_panel(text, matcher), args.repeat)
+        regex_us = time_call(lambda: regex_parse(text, compiled), args.repeat)
+        found = len(parse_lab_panel(text, matcher))
+
+        print(f'{size:>9} {len(compiled):>8} {automaton_us:>13.1f} {regex_us:>10.1f} {found:>6}')
+
+
+if __name__ == '__main__':
+    main()
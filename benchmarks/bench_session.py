@@ -0,0 +1,99 @@
+"""
+Session overhead benchmark: signed cookie sessions vs server-side sessions.
+
+Builds a session shaped like a real one (login details, last_result with
+explanation HTML and tips, and a report history), then measures for each
+backend the Cookie header size a client sends back and the time per request
+for a route that only reads the session (like /api/user) and one that writes
+it (like /api/analyze).
+
+Usage:
+    python benchmarks/bench_session.py [--history 5] [--requests 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify, session
+
+from utils.gemini import get_default_explanation, get_health_tips
+from utils.session_store import ServerSessionInterface, SQLiteSessionStore
+
+
+def sample_result(index):
+    values = {'hemoglobin': 11.5 + index * 0.1, 'blood_sugar': 150.0, 'cholesterol': 245.0}
+    return {
+        'values': values,
+        'risk_level': 'High',
+        'risk_score': 72,
+        'risk_message': 'HIGH RISK - Consult doctor urgently',
+        'risk_color': '#ea580c',
+        'explanation': get_default_explanation(values, 'High'),
+        'tips': get_health_tips(values, 'High'),
+        'timestamp': '2026-01-01T08:30:00',
+        'report_text': ('Hemoglobin: 11.5 g/dL Blood Sugar: 150 mg/dL Cholesterol: 245 mg/dL ' * 8)[:500]
+    }
+
+
+def build_app(backend, history, db_path):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    if backend == 'server':
+        app.session_interface = ServerSessionInterface(SQLiteSessionStore(db_path))
+
+    @app.route('/login')
+    def login():
+        session['user_id'] = 1
+        session['user_name'] = 'Bench'
+        session['user_email'] = 'bench@example.com'
+        session['last_result'] = sample_result(0)
+        session['report_history'] = [sample_result(i) for i in range(history)]
+        return 'ok'
+
+    @app.route('/read')
+    def read():
+        return jsonify({'id': session.get('user_id')})
+
+    @app.route('/write')
+    def write():
+        session['last_result'] = sample_result(1)
+        return 'ok'
+
+    return app
+
+
+def measure(client, path, count):
+    client.get(path)
+    started = time.perf_counter()
+    for _ in range(count):
+        client.get(path)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'backend':>8} {'cookie bytes':>13} {'read us/req':>12} {'write us/req':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ('cookie', 'server'):
+            app = build_app(backend, args.history, os.path.join(tmp, 'sessions.db'))
+            client = app.test_client()
+            client.get('/login')
+            cookie = client.get_cookie('session')
+            cookie_bytes = len(cookie.key) + 1 + len(cookie.value)
+
+            read_us = measure(client, '/read', args.requests)
+            write_us = measure(client, '/write', max(1, args.requests // 10))
+
+            print(f'{backend:>8} {cookie_bytes:>13} {read_us:>12.1f} {write_us:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
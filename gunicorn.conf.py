@@ -0,0 +1,23 @@
+"""
+Gunicorn settings.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+WORKER_CLASS=sync (default) with GUNICORN_THREADS > 1 (default 4) runs
+gunicorn's threaded worker: each worker process serves GUNICORN_THREADS
+requests at once on OS threads, so one slow request doesn't hold the whole
+process; GUNICORN_THREADS=1 keeps one request per worker process. Set
+WORKER_CLASS=gevent to serve LLM-bound routes cooperatively: each worker then
+holds up to WORKER_CONNECTIONS concurrent requests, Gemini calls use the REST
+transport over patched sockets, and OCR/PDF/prediction run on a native thread
+pool (CPU_EXECUTOR_THREADS) so they don't stall other requests.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class = os.environ.get('WORKER_CLASS', 'sync')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 500))
+# More than 1 turns the sync worker into the threaded (gthread) one; unused by gevent
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
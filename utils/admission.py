@@ -0,0 +1,437 @@
+import math
+import os
+import sqlite3
+import time
+import uuid
+from functools import wraps
+
+from flask import jsonify, make_response, request, session
+
+from utils.concurrency import process_alive, run_blocking
+
+# Shared by every worker process on the host, so limits hold across workers
+ADMISSION_DB = os.environ.get('ADMISSION_DB', 'admission.db')
+
+# Request slots the server has in total, from the same settings as gunicorn.conf.py
+WORKER_CLASS = os.environ.get('WORKER_CLASS', 'sync')
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 2))
+if WORKER_CLASS == 'gevent':
+    SLOTS_PER_WORKER = int(os.environ.get('WORKER_CONNECTIONS', 500))
+else:
+    SLOTS_PER_WORKER = int(os.environ.get('GUNICORN_THREADS', 4))
+SERVING_SLOTS = WEB_CONCURRENCY * SLOTS_PER_WORKER
+
+# Slots expensive endpoints can never take, so health checks, login and
+# polling are still served during a spike. With sync workers a request waiting
+# for admission also holds a worker, so waiting requests count too.
+ADMISSION_RESERVED_SLOTS = int(os.environ.get('ADMISSION_RESERVED_SLOTS', max(1, SERVING_SLOTS // 10)))
+ADMISSION_CAPACITY = int(os.environ.get('ADMISSION_CAPACITY',
+                                        max(1, SERVING_SLOTS - ADMISSION_RESERVED_SLOTS)))
+
+# A slot whose worker died is freed once its process is gone or after this long
+ADMISSION_SLOT_LEASE = float(os.environ.get('ADMISSION_SLOT_LEASE', 900))
+
+# A waiting request checks for a free slot after ADMISSION_POLL_SECONDS, then
+# backs off (doubling) to at most ADMISSION_MAX_POLL_SECONDS between checks
+ADMISSION_POLL_SECONDS = 0.05
+ADMISSION_MAX_POLL_SECONDS = 0.5
+
+
+def _env_limit(endpoint, name, default, cast=int):
+    return cast(os.environ.get(f'{endpoint.upper()}_{name}', default))
+
+
+def endpoint_limits(endpoint, max_concurrent, max_queue, queue_timeout, rate_per_minute, burst):
+    """Limits for one endpoint, each overridable with <ENDPOINT>_<SETTING> env vars"""
+    return {
+        'max_concurrent': _env_limit(endpoint, 'MAX_CONCURRENT', max_concurrent),
+        'max_queue': _env_limit(endpoint, 'MAX_QUEUE', max_queue),
+        'queue_timeout': _env_limit(endpoint, 'QUEUE_TIMEOUT', queue_timeout, float),
+        'rate_per_minute': _env_limit(endpoint, 'RATE_PER_MINUTE', rate_per_minute, float),
+        'burst': _env_limit(endpoint, 'BURST', burst)
+    }
+
+
+# Limits apply across all worker processes, and all endpoints together never
+# take more than ADMISSION_CAPACITY slots. OCR-heavy routes get few slots;
+# chat is mostly waiting on the LLM and is sized for the gevent worker, where
+# it can run hundreds at once (with sync workers the capacity caps it).
+ADMISSION_LIMITS = {
+    'analyze': endpoint_limits('analyze', max_concurrent=4, max_queue=8, queue_timeout=5,
+                               rate_per_minute=20, burst=5),
+    'analyze_multiple': endpoint_limits('analyze_multiple', max_concurrent=2, max_queue=4, queue_timeout=5,
+                                        rate_per_minute=5, burst=2),
+    'analyze_bulk': endpoint_limits('analyze_bulk', max_concurrent=1, max_queue=2, queue_timeout=5,
+                                    rate_per_minute=2, burst=1),
+    'jobs': endpoint_limits('jobs', max_concurrent=16, max_queue=32, queue_timeout=2,
+                            rate_per_minute=30, burst=10),
+    'chatbot': endpoint_limits('chatbot', max_concurrent=400, max_queue=400, queue_timeout=5,
+                               rate_per_minute=30, burst=10),
+    'export': endpoint_limits('export', max_concurrent=2, max_queue=4, queue_timeout=5,
+                              rate_per_minute=6, burst=2),
+    # Requests that hold their slot waiting on a job (?wait=, SSE); never queued
+    'job_wait': endpoint_limits('job_wait', max_concurrent=max(2, ADMISSION_CAPACITY // 4), max_queue=0,
+                                queue_timeout=0, rate_per_minute=0, burst=1)
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionStore:
+    """Running and waiting requests and token buckets, shared through SQLite"""
+
+    def __init__(self, db_path=ADMISSION_DB):
+        self.db_path = db_path
+        self.init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False, isolation_level=None)
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS admission_slots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                token TEXT UNIQUE NOT NULL,
+                endpoint TEXT NOT NULL,
+                state TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS admission_buckets (
+                endpoint TEXT NOT NULL,
+                client TEXT NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (endpoint, client)
+            )
+        ''')
+        conn.close()
+
+    def transaction(self):
+        conn = self._connect()
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def purge(self, conn, now):
+        """Free slots whose lease ran out or whose worker process is gone"""
+        conn.execute('DELETE FROM admission_slots WHERE expires_at < ?', (now,))
+        pids = [row[0] for row in conn.execute('SELECT DISTINCT pid FROM admission_slots')]
+        for pid in pids:
+            if not process_alive(pid):
+                conn.execute('DELETE FROM admission_slots WHERE pid = ?', (pid,))
+
+    def counts(self, conn, endpoint):
+        """(running for endpoint, waiting for endpoint, busy across all endpoints)"""
+        running = waiting = busy = 0
+        for row_endpoint, state, count in conn.execute(
+                'SELECT endpoint, state, COUNT(*) FROM admission_slots GROUP BY endpoint, state'):
+            busy += count
+            if row_endpoint == endpoint:
+                if state == 'running':
+                    running = count
+                else:
+                    waiting = count
+        return running, waiting, busy
+
+
+_store = None
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = AdmissionStore()
+    return _store
+
+
+class ConcurrencyLimiter:
+    """
+    At most max_concurrent requests run (across all workers); up to max_queue
+    more wait for a slot for at most queue_timeout seconds, first come first
+    served. Anything beyond that, or beyond ADMISSION_CAPACITY for all
+    endpoints together, is shed at once.
+    """
+
+    def __init__(self, endpoint, max_concurrent, max_queue, queue_timeout, capacity=ADMISSION_CAPACITY):
+        self.endpoint = endpoint
+        self.max_concurrent = min(max_concurrent, capacity)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.capacity = capacity
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        # Moving average of how long an admitted request holds its slot
+        self.avg_service_seconds = 1.0
+
+    def _retry_after(self, waiting):
+        return max(1, math.ceil(self.avg_service_seconds * (waiting + 1) / max(1, self.max_concurrent)))
+
+    def _enter(self, store):
+        """Take a slot or a place in the queue; returns (token, admitted)"""
+        token = uuid.uuid4().hex
+        now = time.time()
+        conn = store.transaction()
+        try:
+            running, waiting, busy = store.counts(conn, self.endpoint)
+            if busy >= self.capacity or running >= self.max_concurrent or waiting:
+                store.purge(conn, now)
+                running, waiting, busy = store.counts(conn, self.endpoint)
+
+            if busy >= self.capacity or (running >= self.max_concurrent and waiting >= self.max_queue):
+                conn.execute('COMMIT')
+                self.shed_queue_full += 1
+                raise Overloaded('queue_full', self._retry_after(waiting))
+
+            admitted = running < self.max_concurrent and waiting == 0
+            conn.execute(
+                'INSERT INTO admission_slots (token, endpoint, state, pid, expires_at) VALUES (?, ?, ?, ?, ?)',
+                (token, self.endpoint, 'running' if admitted else 'waiting', os.getpid(),
+                 now + (ADMISSION_SLOT_LEASE if admitted else self.queue_timeout + 1))
+            )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return token, admitted
+
+    def _try_promote(self, store, token):
+        """Move a waiting request to running if a slot is free and it is next in line"""
+        now = time.time()
+        conn = store.transaction()
+        try:
+            store.purge(conn, now)
+            running, _, _ = store.counts(conn, self.endpoint)
+            free = self.max_concurrent - running
+            if free > 0:
+                next_in_line = [row[0] for row in conn.execute(
+                    "SELECT token FROM admission_slots WHERE endpoint = ? AND state = 'waiting' "
+                    'ORDER BY id LIMIT ?', (self.endpoint, free))]
+                if token in next_in_line:
+                    conn.execute(
+                        "UPDATE admission_slots SET state = 'running', expires_at = ? WHERE token = ?",
+                        (now + ADMISSION_SLOT_LEASE, token)
+                    )
+                    conn.execute('COMMIT')
+                    return True
+            conn.execute('COMMIT')
+            return False
+        finally:
+            conn.close()
+
+    def acquire(self):
+        """
+        Wait for a slot; returns a token for release().
+
+        The SQLite transactions run through run_blocking: under gevent a
+        locked database is waited out in C, which would otherwise stall
+        every other greenlet of the worker.
+        """
+        store = _get_store()
+        token, admitted = run_blocking(self._enter, store)
+        if admitted:
+            self.admitted += 1
+            return token
+
+        self.queued += 1
+        deadline = time.monotonic() + self.queue_timeout
+        delay = ADMISSION_POLL_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            if run_blocking(self._try_promote, store, token):
+                self.admitted += 1
+                return token
+            delay = min(delay * 2, ADMISSION_MAX_POLL_SECONDS)
+
+        run_blocking(self._delete, store, token)
+        self.shed_timeout += 1
+        raise Overloaded('queue_timeout', self._retry_after(self.max_queue))
+
+    def _delete(self, store, token):
+        conn = store.transaction()
+        try:
+            conn.execute('DELETE FROM admission_slots WHERE token = ?', (token,))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def release(self, token, service_seconds):
+        run_blocking(self._delete, _get_store(), token)
+        self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * service_seconds
+
+    def stats(self):
+        store = _get_store()
+        conn = store._connect()
+        try:
+            running, waiting, _ = store.counts(conn, self.endpoint)
+        finally:
+            conn.close()
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'in_flight': running,
+            'waiting': waiting,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_timeout': self.shed_timeout,
+            'avg_service_seconds': round(self.avg_service_seconds, 3)
+        }
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets, shared by all workers: rate_per_minute sustained, burst at once"""
+
+    # Buckets idle this long have refilled completely and are dropped
+    PRUNE_INTERVAL_SECONDS = 10 * 60
+
+    def __init__(self, endpoint, rate_per_minute, burst):
+        self.endpoint = endpoint
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.rate_limited = 0
+        self._last_prune = 0.0
+
+    def consume(self, key):
+        """Take one token; returns 0 if allowed, else seconds until one is available"""
+        if self.rate <= 0:
+            return 0
+
+        allowed, tokens = run_blocking(self._take, key)
+        if allowed:
+            return 0
+        self.rate_limited += 1
+        return (1 - tokens) / self.rate
+
+    def _take(self, key):
+        now = time.time()
+        store = _get_store()
+        conn = store.transaction()
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM admission_buckets WHERE endpoint = ? AND client = ?',
+                (self.endpoint, key)
+            ).fetchone()
+            tokens, last = row if row else (self.burst, now)
+            tokens = min(self.burst, tokens + max(0.0, now - last) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                'INSERT OR REPLACE INTO admission_buckets (endpoint, client, tokens, updated_at) VALUES (?, ?, ?, ?)',
+                (self.endpoint, key, tokens, now)
+            )
+            if now - self._last_prune > self.PRUNE_INTERVAL_SECONDS:
+                self._last_prune = now
+                conn.execute('DELETE FROM admission_buckets WHERE endpoint = ? AND updated_at < ?',
+                             (self.endpoint, now - self.burst / self.rate))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return allowed, tokens
+
+
+_limiters = {}
+_buckets = {}
+
+
+def _client_key():
+    user_id = session.get('user_id')
+    if user_id is not None:
+        return f'user:{user_id}'
+    return f'ip:{request.remote_addr}'
+
+
+def _shed_response(status, message, retry_after):
+    response = make_response(jsonify({'error': message, 'retry_after': retry_after}), status)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _register(endpoint):
+    limits = ADMISSION_LIMITS[endpoint]
+    limiter = _limiters[endpoint] = ConcurrencyLimiter(
+        endpoint, limits['max_concurrent'], limits['max_queue'], limits['queue_timeout']
+    )
+    buckets = _buckets[endpoint] = TokenBucketLimiter(endpoint, limits['rate_per_minute'], limits['burst'])
+    return limiter, buckets
+
+
+def acquire_wait_slot():
+    """
+    Take a 'job_wait' slot for a request about to wait on a job; returns a
+    function that releases it, or None if the request should answer at once
+    instead. Never waits for the slot, and with one request per worker
+    process (SLOTS_PER_WORKER == 1) never hands one out: the wait would
+    hold the whole process.
+    """
+    if SLOTS_PER_WORKER <= 1:
+        return None
+    limiter = _limiters.get('job_wait') or _register('job_wait')[0]
+    try:
+        token = limiter.acquire()
+    except Overloaded:
+        return None
+
+    started = time.monotonic()
+    return lambda: limiter.release(token, time.monotonic() - started)
+
+
+def admission_controlled(endpoint):
+    """
+    Apply ADMISSION_LIMITS[endpoint] to a view.
+
+    Over the per-user rate the request gets 429; when all slots are busy and
+    the wait queue is full or the wait times out it gets 503. Both carry a
+    Retry-After header. Streamed responses keep their slot until the stream
+    is closed.
+    """
+    limiter, buckets = _register(endpoint)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            wait_seconds = buckets.consume(_client_key())
+            if wait_seconds:
+                return _shed_response(429, 'Too many requests, please slow down', max(1, math.ceil(wait_seconds)))
+
+            try:
+                token = limiter.acquire()
+            except Overloaded as e:
+                return _shed_response(503, 'Server is busy, please retry shortly', e.retry_after)
+
+            started = time.monotonic()
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                limiter.release(token, time.monotonic() - started)
+                raise
+
+            if response.is_streamed:
+                response.call_on_close(lambda: limiter.release(token, time.monotonic() - started))
+            else:
+                limiter.release(token, time.monotonic() - started)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def admission_stats():
+    """Current load across all workers, and this worker's shedding counters, for every controlled endpoint"""
+    return {
+        endpoint: dict(limiter.stats(), rate_limited=_buckets[endpoint].rate_limited)
+        for endpoint, limiter in _limiters.items()
+    }
@@ -0,0 +1,340 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from utils.analytes import ANALYTES_BY_KEY
+from utils.model_registry import RISK_LABELS
+
+AGGREGATES_DB = os.environ.get('AGGREGATES_DB', 'aggregates.db')
+
+# Relative error of quantiles and percentile ranks answered from the sketches
+SKETCH_RELATIVE_ACCURACY = float(os.environ.get('SKETCH_RELATIVE_ACCURACY', 0.01))
+
+# How often each worker merges its pending updates into the shared store and
+# reloads everyone else's
+AGGREGATES_FLUSH_SECONDS = float(os.environ.get('AGGREGATES_FLUSH_SECONDS', 10))
+
+CORE_ANALYTES = ['hemoglobin', 'blood_sugar', 'cholesterol']
+
+
+class DDSketch:
+    """
+    Quantile sketch with relative-error guarantees (DDSketch).
+
+    Values are counted in logarithmic buckets of width gamma = (1+a)/(1-a), so
+    any quantile is answered within relative accuracy `a` using memory that
+    depends on the value range, not on how many values were added. Two
+    sketches with the same accuracy merge exactly by adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _bin_value(self, index):
+        # Midpoint (in relative terms) of the bucket (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            index = self._index(value)
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracy')
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return min(max(self._bin_value(index), self.min), self.max)
+        return self.max
+
+    def rank(self, value):
+        """Fraction of values below `value` (values in the same bucket count half)"""
+        if self.count == 0:
+            return None
+        if value <= 0:
+            return self.zero_count / 2 / self.count
+
+        target = self._index(value)
+        below = self.zero_count
+        same = 0
+        for index, count in self.bins.items():
+            if index < target:
+                below += count
+            elif index == target:
+                same = count
+        return (below + same / 2) / self.count
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'bins': {str(index): count for index, count in self.bins.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'])
+        sketch.bins = {int(index): count for index, count in data['bins'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+
+def time_bucket(when=None):
+    """Monthly bucket ('YYYY-MM', UTC) an analysis is counted in"""
+    when = when or datetime.now(timezone.utc)
+    return when.strftime('%Y-%m')
+
+
+def recent_buckets(months, now=None):
+    now = now or datetime.now(timezone.utc)
+    year, month = now.year, now.month
+    buckets = []
+    for _ in range(months):
+        buckets.append(f'{year:04d}-{month:02d}')
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return buckets
+
+
+class PopulationAggregates:
+    """
+    Population distributions per (analyte, risk level, month), built from
+    every recorded analysis without storing or scanning the reports.
+
+    Each worker adds values to in-memory pending sketches; a background thread
+    periodically merges them into SQLite (read-merge-write in one transaction,
+    so concurrent workers never lose each other's counts) and reloads the
+    merged totals. Queries read the cached merge of the matching sketches, so
+    their cost is independent of how many reports have been analyzed.
+    """
+
+    def __init__(self, db_path=AGGREGATES_DB, flush_interval=AGGREGATES_FLUSH_SECONDS):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._view = {}
+        self._merged = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.loaded_at = 0.0
+        self.init_db()
+        self.reload()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS population_sketches (
+                analyte TEXT NOT NULL,
+                risk_level TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sketch TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (analyte, risk_level, bucket)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def record(self, values, risk_level, lab_panel=None, when=None):
+        """Count one analysis: the core values plus any other lab panel analytes"""
+        measurements = {key: values.get(key) for key in CORE_ANALYTES}
+        for key, entry in (lab_panel or {}).items():
+            measurements.setdefault(key, entry.get('value'))
+
+        bucket = time_bucket(when)
+        level = str(risk_level)
+        with self._lock:
+            for analyte, value in measurements.items():
+                if value is None:
+                    continue
+                key = (analyte, level, bucket)
+                sketch = self._pending.get(key)
+                if sketch is None:
+                    sketch = self._pending[key] = DDSketch()
+                sketch.add(float(value))
+
+    def flush(self):
+        """Merge pending updates into the shared store; returns the number of sketches written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        with self._flush_lock:
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for (analyte, level, bucket), sketch in pending.items():
+                    row = conn.execute(
+                        'SELECT sketch FROM population_sketches WHERE analyte = ? AND risk_level = ? AND bucket = ?',
+                        (analyte, level, bucket)
+                    ).fetchone()
+                    if row:
+                        sketch = DDSketch.from_dict(json.loads(row['sketch'])).merge(sketch)
+                    conn.execute(
+                        'INSERT OR REPLACE INTO population_sketches '
+                        '(analyte, risk_level, bucket, count, sketch, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                        (analyte, level, bucket, sketch.count, json.dumps(sketch.to_dict()), time.time())
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                # Put the updates back so they are retried on the next flush
+                with self._lock:
+                    for key, sketch in pending.items():
+                        if key in self._pending:
+                            sketch.merge(self._pending[key])
+                        self._pending[key] = sketch
+                raise
+            finally:
+                conn.close()
+        return len(pending)
+
+    def reload(self):
+        """Replace the cached view with the merged totals from all workers"""
+        conn = self._connect()
+        rows = conn.execute('SELECT analyte, risk_level, bucket, sketch FROM population_sketches').fetchall()
+        conn.close()
+
+        view = {}
+        for row in rows:
+            sketch = DDSketch.from_dict(json.loads(row['sketch']))
+            view.setdefault(row['analyte'], {})[(row['risk_level'], row['bucket'])] = sketch
+        self._view = view
+        self._merged = {}
+        self.loaded_at = time.time()
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.reload()
+            except Exception as e:
+                print(f"Aggregates flush error: {str(e)}")
+
+    def start(self):
+        """Start the background flush/reload thread (once per process)"""
+        if self._thread or self.flush_interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='aggregates-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self.flush()
+
+    def sketch(self, analyte, risk_level=None, months=None):
+        """
+        Merged distribution for an analyte, optionally for one risk level and
+        the last N months. Merges are cached until the next reload; raises
+        ValueError for an analyte or risk level outside the catalog, so query
+        strings can't grow the cache.
+        """
+        if analyte not in ANALYTES_BY_KEY:
+            raise ValueError(f'Unknown analyte: {analyte}')
+        if risk_level is not None and risk_level not in RISK_LABELS:
+            raise ValueError(f'Unknown risk level: {risk_level}. Use one of: {", ".join(sorted(RISK_LABELS))}')
+
+        key = (analyte, risk_level, months)
+        merged = self._merged.get(key)
+        if merged is not None:
+            return merged
+
+        buckets = set(recent_buckets(months)) if months else None
+        merged = DDSketch()
+        for (level, bucket), sketch in self._view.get(analyte, {}).items():
+            if risk_level is not None and level != risk_level:
+                continue
+            if buckets is not None and bucket not in buckets:
+                continue
+            merged.merge(sketch)
+        self._merged[key] = merged
+        return merged
+
+    def percentile_rank(self, analyte, value, risk_level=None, months=None):
+        sketch = self.sketch(analyte, risk_level, months)
+        rank = sketch.rank(value)
+        return {
+            'analyte': analyte,
+            'value': value,
+            'percentile': round(rank * 100, 1) if rank is not None else None,
+            'population': sketch.count,
+            'risk_level': risk_level,
+            'months': months,
+            'as_of': self.loaded_at
+        }
+
+    def summary(self, analyte, risk_level=None, months=None):
+        sketch = self.sketch(analyte, risk_level, months)
+        quantiles = {f'p{int(q * 100)}': sketch.quantile(q) for q in (0.05, 0.25, 0.5, 0.75, 0.95)}
+        return {
+            'analyte': analyte,
+            'population': sketch.count,
+            'mean': round(sketch.sum / sketch.count, 2) if sketch.count else None,
+            'min': sketch.min,
+            'max': sketch.max,
+            'quantiles': {name: round(value, 2) if value is not None else None for name, value in quantiles.items()},
+            'risk_level': risk_level,
+            'months': months,
+            'as_of': self.loaded_at
+        }
+
+    def analytes(self):
+        return sorted(self._view)
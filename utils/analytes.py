@@ -0,0 +1,233 @@
+"""
+Analyte catalog used by the lab panel parser.
+
+Each entry describes one analyte:
+    key          - identifier used in parsed results
+    name         - display name
+    panel        - the lab panel it usually appears in
+    unit         - canonical unit that parsed values are converted to
+    aliases      - names the analyte is reported under (case-insensitive)
+    units        - accepted units and the factor converting them to `unit`
+    valid_range  - plausible (min, max) in the canonical unit; values outside
+                   it are almost certainly parsing or unit errors
+    normal_range - reference (min, max) in the canonical unit, None if open
+
+The first three entries are the analytes the risk model was trained on; their
+keys match the ones returned by parse_medical_values.
+"""
+
+GLUCOSE_MMOL_TO_MG = 18.016
+CHOLESTEROL_MMOL_TO_MG = 38.67
+TRIGLYCERIDE_MMOL_TO_MG = 88.57
+
+ANALYTE_CATALOG = [
+    # Core analytes used by the risk model
+    {'key': 'hemoglobin', 'name': 'Hemoglobin', 'panel': 'CBC', 'unit': 'g/dL',
+     'aliases': ['hemoglobin', 'haemoglobin', 'hb', 'hgb'],
+     'units': {'g/dl': 1.0, 'g/l': 0.1, 'mmol/l': 1.611},
+     'valid_range': (5, 25), 'normal_range': (12, 17.5)},
+    {'key': 'blood_sugar', 'name': 'Blood Sugar', 'panel': 'Glucose', 'unit': 'mg/dL',
+     'aliases': ['blood sugar', 'blood glucose', 'glucose', 'fasting glucose', 'fasting blood sugar',
+                 'fasting plasma glucose', 'fbs', 'fpg'],
+     'units': {'mg/dl': 1.0, 'mmol/l': GLUCOSE_MMOL_TO_MG},
+     'valid_range': (40, 400), 'normal_range': (70, 110)},
+    {'key': 'cholesterol', 'name': 'Total Cholesterol', 'panel': 'Lipid', 'unit': 'mg/dL',
+     'aliases': ['cholesterol', 'total cholesterol', 'cholesterol total', 'cholesterol, total', 'chol',
+                 'serum cholesterol'],
+     'units': {'mg/dl': 1.0, 'mmol/l': CHOLESTEROL_MMOL_TO_MG},
+     'valid_range': (100, 400), 'normal_range': (None, 200)},
+
+    # Complete blood count
+    {'key': 'hematocrit', 'name': 'Hematocrit', 'panel': 'CBC', 'unit': '%',
+     'aliases': ['hematocrit', 'haematocrit', 'hct', 'pcv', 'packed cell volume'],
+     'units': {'%': 1.0, 'l/l': 100.0},
+     'valid_range': (10, 75), 'normal_range': (36, 50)},
+    {'key': 'rbc', 'name': 'Red Blood Cells', 'panel': 'CBC', 'unit': 'million/uL',
+     'aliases': ['rbc', 'rbc count', 'red blood cells', 'red blood cell count', 'erythrocytes', 'total rbc'],
+     'units': {'million/ul': 1.0, 'x10^6/ul': 1.0, '10^6/ul': 1.0, 'x10^12/l': 1.0, '10^12/l': 1.0},
+     'valid_range': (1, 10), 'normal_range': (4.2, 5.9)},
+    {'key': 'wbc', 'name': 'White Blood Cells', 'panel': 'CBC', 'unit': 'thousand/uL',
+     'aliases': ['wbc', 'wbc count', 'white blood cells', 'white blood cell count', 'leukocytes',
+                 'total leukocyte count', 'tlc'],
+     'units': {'thousand/ul': 1.0, 'x10^3/ul': 1.0, '10^3/ul': 1.0, 'x10^9/l': 1.0, '10^9/l': 1.0,
+               '/ul': 0.001, 'cells/ul': 0.001, '/cumm': 0.001, 'cells/cumm': 0.001},
+     'valid_range': (0.5, 100), 'normal_range': (4, 11)},
+    {'key': 'platelets', 'name': 'Platelets', 'panel': 'CBC', 'unit': 'thousand/uL',
+     'aliases': ['platelets', 'platelet count', 'plt', 'thrombocytes'],
+     'units': {'thousand/ul': 1.0, 'x10^3/ul': 1.0, '10^3/ul': 1.0, 'x10^9/l': 1.0, '10^9/l': 1.0,
+               'lakh/cumm': 100.0, '/ul': 0.001, '/cumm': 0.001},
+     'valid_range': (5, 1500), 'normal_range': (150, 450)},
+    {'key': 'mcv', 'name': 'Mean Corpuscular Volume', 'panel': 'CBC', 'unit': 'fL',
+     'aliases': ['mcv', 'mean corpuscular volume', 'mean cell volume'],
+     'units': {'fl': 1.0},
+     'valid_range': (50, 150), 'normal_range': (80, 100)},
+    {'key': 'mch', 'name': 'Mean Corpuscular Hemoglobin', 'panel': 'CBC', 'unit': 'pg',
+     'aliases': ['mch', 'mean corpuscular hemoglobin', 'mean corpuscular haemoglobin'],
+     'units': {'pg': 1.0},
+     'valid_range': (10, 50), 'normal_range': (27, 33)},
+    {'key': 'mchc', 'name': 'Mean Corpuscular Hemoglobin Concentration', 'panel': 'CBC', 'unit': 'g/dL',
+     'aliases': ['mchc', 'mean corpuscular hemoglobin concentration',
+                 'mean corpuscular haemoglobin concentration'],
+     'units': {'g/dl': 1.0, 'g/l': 0.1},
+     'valid_range': (20, 45), 'normal_range': (32, 36)},
+    {'key': 'rdw', 'name': 'Red Cell Distribution Width', 'panel': 'CBC', 'unit': '%',
+     'aliases': ['rdw', 'rdw-cv', 'red cell distribution width'],
+     'units': {'%': 1.0},
+     'valid_range': (5, 40), 'normal_range': (11.5, 14.5)},
+    {'key': 'neutrophils', 'name': 'Neutrophils', 'panel': 'CBC', 'unit': '%',
+     'aliases': ['neutrophils', 'neutrophil', 'polymorphs', 'neut'],
+     'units': {'%': 1.0},
+     'valid_range': (0, 100), 'normal_range': (40, 70)},
+    {'key': 'lymphocytes', 'name': 'Lymphocytes', 'panel': 'CBC', 'unit': '%',
+     'aliases': ['lymphocytes', 'lymphocyte', 'lymph'],
+     'units': {'%': 1.0},
+     'valid_range': (0, 100), 'normal_range': (20, 40)},
+    {'key': 'monocytes', 'name': 'Monocytes', 'panel': 'CBC', 'unit': '%',
+     'aliases': ['monocytes', 'monocyte', 'mono'],
+     'units': {'%': 1.0},
+     'valid_range': (0, 100), 'normal_range': (2, 8)},
+    {'key': 'eosinophils', 'name': 'Eosinophils', 'panel': 'CBC', 'unit': '%',
+     'aliases': ['eosinophils', 'eosinophil', 'eos'],
+     'units': {'%': 1.0},
+     'valid_range': (0, 100), 'normal_range': (1, 4)},
+    {'key': 'basophils', 'name': 'Basophils', 'panel': 'CBC', 'unit': '%',
+     'aliases': ['basophils', 'basophil', 'baso'],
+     'units': {'%': 1.0},
+     'valid_range': (0, 100), 'normal_range': (0, 1)},
+    {'key': 'esr', 'name': 'Erythrocyte Sedimentation Rate', 'panel': 'CBC', 'unit': 'mm/hr',
+     'aliases': ['esr', 'erythrocyte sedimentation rate', 'sed rate'],
+     'units': {'mm/hr': 1.0, 'mm/h': 1.0, 'mm/1st hr': 1.0},
+     'valid_range': (0, 150), 'normal_range': (0, 20)},
+
+    # Glucose metabolism
+    {'key': 'postprandial_glucose', 'name': 'Postprandial Glucose', 'panel': 'Glucose', 'unit': 'mg/dL',
+     'aliases': ['postprandial glucose', 'post prandial glucose', 'postprandial blood sugar',
+                 'post prandial blood sugar', 'ppbs', 'pp glucose', 'pp blood sugar'],
+     'units': {'mg/dl': 1.0, 'mmol/l': GLUCOSE_MMOL_TO_MG},
+     'valid_range': (40, 600), 'normal_range': (None, 140)},
+    {'key': 'random_glucose', 'name': 'Random Glucose', 'panel': 'Glucose', 'unit': 'mg/dL',
+     'aliases': ['random glucose', 'random blood sugar', 'random blood glucose', 'rbs'],
+     'units': {'mg/dl': 1.0, 'mmol/l': GLUCOSE_MMOL_TO_MG},
+     'valid_range': (40, 600), 'normal_range': (None, 140)},
+    {'key': 'hba1c', 'name': 'HbA1c', 'panel': 'Glucose', 'unit': '%',
+     'aliases': ['hba1c', 'hb a1c', 'a1c', 'glycated hemoglobin', 'glycated haemoglobin',
+                 'glycosylated hemoglobin', 'glycosylated haemoglobin'],
+     'units': {'%': 1.0},
+     'valid_range': (3, 20), 'normal_range': (None, 5.7)},
+
+    # Lipid profile
+    {'key': 'hdl', 'name': 'HDL Cholesterol', 'panel': 'Lipid', 'unit': 'mg/dL',
+     'aliases': ['hdl', 'hdl cholesterol', 'hdl-c', 'hdl-cholesterol', 'high density lipoprotein'],
+     'units': {'mg/dl': 1.0, 'mmol/l': CHOLESTEROL_MMOL_TO_MG},
+     'valid_range': (5, 150), 'normal_range': (40, None)},
+    {'key': 'ldl', 'name': 'LDL Cholesterol', 'panel': 'Lipid', 'unit': 'mg/dL',
+     'aliases': ['ldl', 'ldl cholesterol', 'ldl-c', 'ldl-cholesterol', 'low density lipoprotein'],
+     'units': {'mg/dl': 1.0, 'mmol/l': CHOLESTEROL_MMOL_TO_MG},
+     'valid_range': (10, 400), 'normal_range': (None, 100)},
+    {'key': 'vldl', 'name': 'VLDL Cholesterol', 'panel': 'Lipid', 'unit': 'mg/dL',
+     'aliases': ['vldl', 'vldl cholesterol', 'vldl-c', 'very low density lipoprotein'],
+     'units': {'mg/dl': 1.0, 'mmol/l': CHOLESTEROL_MMOL_TO_MG},
+     'valid_range': (1, 200), 'normal_range': (None, 30)},
+    {'key': 'triglycerides', 'name': 'Triglycerides', 'panel': 'Lipid', 'unit': 'mg/dL',
+     'aliases': ['triglycerides', 'triglyceride', 'tg', 'trigs', 'serum triglycerides'],
+     'units': {'mg/dl': 1.0, 'mmol/l': TRIGLYCERIDE_MMOL_TO_MG},
+     'valid_range': (10, 5000), 'normal_range': (None, 150)},
+
+    # Liver function
+    {'key': 'alt', 'name': 'ALT (SGPT)', 'panel': 'Liver', 'unit': 'U/L',
+     'aliases': ['alt', 'sgpt', 'alanine aminotransferase', 'alanine transaminase', 'alt (sgpt)', 'sgpt (alt)'],
+     'units': {'u/l': 1.0, 'iu/l': 1.0},
+     'valid_range': (1, 5000), 'normal_range': (7, 56)},
+    {'key': 'ast', 'name': 'AST (SGOT)', 'panel': 'Liver', 'unit': 'U/L',
+     'aliases': ['ast', 'sgot', 'aspartate aminotransferase', 'aspartate transaminase', 'ast (sgot)', 'sgot (ast)'],
+     'units': {'u/l': 1.0, 'iu/l': 1.0},
+     'valid_range': (1, 5000), 'normal_range': (10, 40)},
+    {'key': 'alp', 'name': 'Alkaline Phosphatase', 'panel': 'Liver', 'unit': 'U/L',
+     'aliases': ['alp', 'alkaline phosphatase', 'alk phos'],
+     'units': {'u/l': 1.0, 'iu/l': 1.0},
+     'valid_range': (5, 3000), 'normal_range': (44, 147)},
+    {'key': 'ggt', 'name': 'Gamma-Glutamyl Transferase', 'panel': 'Liver', 'unit': 'U/L',
+     'aliases': ['ggt', 'gamma gt', 'gamma-gt', 'gamma glutamyl transferase', 'gamma-glutamyl transferase'],
+     'units': {'u/l': 1.0, 'iu/l': 1.0},
+     'valid_range': (1, 3000), 'normal_range': (9, 48)},
+    {'key': 'total_bilirubin', 'name': 'Total Bilirubin', 'panel': 'Liver', 'unit': 'mg/dL',
+     'aliases': ['bilirubin', 'total bilirubin', 'bilirubin total', 'serum bilirubin', 't. bilirubin'],
+     'units': {'mg/dl': 1.0, 'umol/l': 1 / 17.1},
+     'valid_range': (0.05, 40), 'normal_range': (0.1, 1.2)},
+    {'key': 'direct_bilirubin', 'name': 'Direct Bilirubin', 'panel': 'Liver', 'unit': 'mg/dL',
+     'aliases': ['direct bilirubin', 'bilirubin direct', 'conjugated bilirubin', 'd. bilirubin'],
+     'units': {'mg/dl': 1.0, 'umol/l': 1 / 17.1},
+     'valid_range': (0, 30), 'normal_range': (None, 0.3)},
+    {'key': 'albumin', 'name': 'Albumin', 'panel': 'Liver', 'unit': 'g/dL',
+     'aliases': ['albumin', 'serum albumin'],
+     'units': {'g/dl': 1.0, 'g/l': 0.1},
+     'valid_range': (1, 7), 'normal_range': (3.5, 5.0)},
+    {'key': 'total_protein', 'name': 'Total Protein', 'panel': 'Liver', 'unit': 'g/dL',
+     'aliases': ['total protein', 'protein total', 'serum protein'],
+     'units': {'g/dl': 1.0, 'g/l': 0.1},
+     'valid_range': (2, 12), 'normal_range': (6.0, 8.3)},
+    {'key': 'globulin', 'name': 'Globulin', 'panel': 'Liver', 'unit': 'g/dL',
+     'aliases': ['globulin', 'serum globulin'],
+     'units': {'g/dl': 1.0, 'g/l': 0.1},
+     'valid_range': (0.5, 8), 'normal_range': (2.0, 3.5)},
+
+    # Kidney function and electrolytes
+    {'key': 'creatinine', 'name': 'Creatinine', 'panel': 'Kidney', 'unit': 'mg/dL',
+     'aliases': ['creatinine', 'serum creatinine', 's. creatinine', 'creat'],
+     'units': {'mg/dl': 1.0, 'umol/l': 1 / 88.4},
+     'valid_range': (0.1, 25), 'normal_range': (0.6, 1.3)},
+    {'key': 'bun', 'name': 'Blood Urea Nitrogen', 'panel': 'Kidney', 'unit': 'mg/dL',
+     'aliases': ['bun', 'blood urea nitrogen', 'urea nitrogen'],
+     'units': {'mg/dl': 1.0, 'mmol/l': 2.8},
+     'valid_range': (1, 200), 'normal_range': (7, 20)},
+    {'key': 'urea', 'name': 'Urea', 'panel': 'Kidney', 'unit': 'mg/dL',
+     'aliases': ['urea', 'blood urea', 'serum urea'],
+     'units': {'mg/dl': 1.0, 'mmol/l': 6.006},
+     'valid_range': (2, 400), 'normal_range': (15, 45)},
+    {'key': 'uric_acid', 'name': 'Uric Acid', 'panel': 'Kidney', 'unit': 'mg/dL',
+     'aliases': ['uric acid', 'serum uric acid', 'urate'],
+     'units': {'mg/dl': 1.0, 'umol/l': 1 / 59.48},
+     'valid_range': (0.5, 20), 'normal_range': (3.5, 7.2)},
+    {'key': 'egfr', 'name': 'eGFR', 'panel': 'Kidney', 'unit': 'mL/min/1.73m2',
+     'aliases': ['egfr', 'estimated gfr', 'gfr', 'estimated glomerular filtration rate'],
+     'units': {'ml/min/1.73m2': 1.0, 'ml/min/1.73m^2': 1.0, 'ml/min': 1.0},
+     'valid_range': (1, 200), 'normal_range': (90, None)},
+    {'key': 'sodium', 'name': 'Sodium', 'panel': 'Kidney', 'unit': 'mmol/L',
+     'aliases': ['sodium', 'na', 'na+', 'serum sodium'],
+     'units': {'mmol/l': 1.0, 'meq/l': 1.0},
+     'valid_range': (100, 180), 'normal_range': (135, 145)},
+    {'key': 'potassium', 'name': 'Potassium', 'panel': 'Kidney', 'unit': 'mmol/L',
+     'aliases': ['potassium', 'k+', 'serum potassium'],
+     'units': {'mmol/l': 1.0, 'meq/l': 1.0},
+     'valid_range': (1.5, 9), 'normal_range': (3.5, 5.1)},
+    {'key': 'chloride', 'name': 'Chloride', 'panel': 'Kidney', 'unit': 'mmol/L',
+     'aliases': ['chloride', 'cl-', 'serum chloride'],
+     'units': {'mmol/l': 1.0, 'meq/l': 1.0},
+     'valid_range': (70, 140), 'normal_range': (98, 107)},
+    {'key': 'bicarbonate', 'name': 'Bicarbonate', 'panel': 'Kidney', 'unit': 'mmol/L',
+     'aliases': ['bicarbonate', 'hco3', 'total co2', 'co2'],
+     'units': {'mmol/l': 1.0, 'meq/l': 1.0},
+     'valid_range': (5, 50), 'normal_range': (22, 29)},
+    {'key': 'calcium', 'name': 'Calcium', 'panel': 'Kidney', 'unit': 'mg/dL',
+     'aliases': ['calcium', 'serum calcium', 'total calcium'],
+     'units': {'mg/dl': 1.0, 'mmol/l': 4.008},
+     'valid_range': (4, 16), 'normal_range': (8.5, 10.5)},
+    {'key': 'phosphorus', 'name': 'Phosphorus', 'panel': 'Kidney', 'unit': 'mg/dL',
+     'aliases': ['phosphorus', 'phosphate', 'inorganic phosphorus', 'serum phosphorus'],
+     'units': {'mg/dl': 1.0, 'mmol/l': 3.097},
+     'valid_range': (0.5, 15), 'normal_range': (2.5, 4.5)},
+]
+
+# Keys returned by parse_medical_values and used by the risk model
+CORE_ANALYTES = ['hemoglobin', 'blood_sugar', 'cholesterol']
+
+ANALYTES_BY_KEY = {analyte['key']: analyte for analyte in ANALYTE_CATALOG}
+
+
+def normalize_unit(unit):
+    """Canonical lookup form of a unit string: lowercase, no spaces, u for micro"""
+    if not unit:
+        return ''
+    unit = unit.lower().replace('µ', 'u').replace('μ', 'u').replace(' ', '')
+    unit = unit.replace('×', 'x').replace('*', 'x')
+    return unit.rstrip('.')
@@ -0,0 +1,216 @@
+"""
+Batch (re)scoring of stored reports with the risk model.
+
+Reads a CSV or Parquet file with hemoglobin, blood_sugar and cholesterol
+columns in chunks, scores the chunks on a process pool and streams the rows
+back out with risk_level, risk_score and one probability column per class.
+Other input columns (e.g. report_id from /api/reports/export) are passed
+through, so an export can be rescored after the model is retrained.
+Missing values are filled from the export's imputed_* columns, which hold
+what the live path imputed from the user's history or the cohort, so a
+rescore sees the same model input as the original analysis.
+
+CLI:
+    python -m utils.batch_scoring reports.parquet rescored.parquet [--model model/risk_model.pkl]
+        [--workers N] [--chunk-size N]
+
+Parquet input or output needs pyarrow.
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils.model_registry import FEATURES, ML_DEFAULTS, MODEL_PATH, load_model
+from utils.risk_scoring import calculate_risk_score
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 10000))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 2))
+
+# Model loaded once per pool process by _init_worker
+_worker_model = None
+
+
+def _file_format(path):
+    return 'parquet' if path.lower().endswith(('.parquet', '.pq')) else 'csv'
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError('Parquet files require pyarrow (pip install pyarrow)')
+
+
+def _optional(value):
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else float(value)
+
+
+def score_frame(model, frame):
+    """
+    Score a DataFrame chunk with the model input the live path used: missing
+    values come from the imputed_<analyte> columns when present, else
+    ML_DEFAULTS (input without recorded imputations). The risk score sees
+    the values as reported.
+    """
+    missing = [column for column in FEATURES if column not in frame.columns]
+    if missing:
+        raise ValueError(f'Input is missing column(s): {", ".join(missing)}')
+
+    scored = frame.copy()
+    if scored.empty:
+        # e.g. the header-only export of a user without reports
+        scored['risk_level'] = pd.Series(dtype=object)
+        scored['risk_score'] = pd.Series(dtype='int64')
+        return scored
+
+    features = frame[FEATURES].apply(pd.to_numeric, errors='coerce')
+    model_input = features.copy()
+    for column in FEATURES:
+        imputed = f'imputed_{column}'
+        if imputed in frame.columns:
+            model_input[column] = model_input[column].fillna(pd.to_numeric(frame[imputed], errors='coerce'))
+    model_input = model_input.fillna(ML_DEFAULTS)
+
+    predictions = model.predict(model_input)
+    probabilities = model.predict_proba(model_input) if hasattr(model, 'predict_proba') else None
+
+    scores = []
+    for row, prediction in zip(features.itertuples(index=False), predictions):
+        values = {column: _optional(value) for column, value in zip(FEATURES, row)}
+        scores.append(calculate_risk_score(values, str(prediction)))
+
+    scored['risk_level'] = [str(prediction) for prediction in predictions]
+    scored['risk_score'] = scores
+    if probabilities is not None:
+        for index, label in enumerate(model.classes_):
+            scored[f'probability_{str(label).lower()}'] = probabilities[:, index].round(4)
+    return scored
+
+
+def _init_worker(model_path):
+    global _worker_model
+    _worker_model = load_model(model_path).model
+
+
+def _score_in_worker(frame):
+    return score_frame(_worker_model, frame)
+
+
+def read_chunks(path, chunk_size=BATCH_CHUNK_SIZE):
+    """Yield DataFrames of at most chunk_size rows from a CSV or Parquet file"""
+    if _file_format(path) == 'parquet':
+        _require_pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Appends scored chunks to a CSV or Parquet file as they arrive"""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = _file_format(path)
+        self._parquet = None
+        self._header_written = False
+        if self.format == 'parquet':
+            _require_pyarrow()
+
+    def write(self, frame):
+        if self.format == 'parquet':
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema, compression='snappy')
+            else:
+                table = table.cast(self._parquet.schema)
+            self._parquet.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='a' if self._header_written else 'w',
+                         header=not self._header_written, index=False)
+            self._header_written = True
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def iter_scored(chunks, model_path=MODEL_PATH, workers=BATCH_WORKERS):
+    """
+    Score chunks in order. With more than one worker, chunks are spread over a
+    process pool with at most workers * 2 in flight, so memory stays bounded
+    however large the input is.
+    """
+    if workers <= 1:
+        model = load_model(model_path).model
+        for frame in chunks:
+            yield score_frame(model, frame)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_path,)) as executor:
+        pending = deque()
+        for frame in chunks:
+            pending.append(executor.submit(_score_in_worker, frame))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def score_file(input_path, output_path, model_path=MODEL_PATH, workers=BATCH_WORKERS,
+               chunk_size=BATCH_CHUNK_SIZE, progress=None):
+    """Rescore input_path into output_path; returns row count, seconds and rows/sec"""
+    started = time.perf_counter()
+    rows = 0
+    writer = ChunkWriter(output_path)
+    try:
+        for scored in iter_scored(read_chunks(input_path, chunk_size), model_path, workers):
+            writer.write(scored)
+            rows += len(scored)
+            if progress:
+                elapsed = time.perf_counter() - started
+                progress(rows, elapsed)
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='CSV or Parquet file with hemoglobin, blood_sugar, cholesterol')
+    parser.add_argument('output', help='CSV or Parquet file to write (by extension)')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    def progress(rows, elapsed):
+        rate = rows / elapsed if elapsed else 0
+        print(f'\r{rows} rows scored, {rate:,.0f} rows/sec', end='', file=sys.stderr, flush=True)
+
+    stats = score_file(args.input, args.output, args.model, args.workers, args.chunk_size, progress)
+    rate = f"{stats['rows_per_second']:,.0f}" if stats['rows_per_second'] is not None else '-'
+    print(f"\nScored {stats['rows']} rows in {stats['seconds']}s ({rate} rows/sec) -> {args.output}",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from utils.uploads import KIND_NAMES, REPORT_KINDS, content_kind
+
+BULK_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'txt'}
+
+# Largest single report accepted inside an archive or NDJSON stream
+BULK_MAX_ENTRY_SIZE = int(os.environ.get('BULK_MAX_ENTRY_SIZE', 16 * 1024 * 1024))
+
+# Reports analyzed at the same time; also bounds how many are held in memory
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', 4))
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Starts each record of an application/json-seq stream (RFC 7464)
+RECORD_SEPARATOR = b'\x1e'
+
+
+class BulkEntryError(Exception):
+    """A single archive or stream entry that cannot be analyzed"""
+
+
+def spool_to_tempfile(stream):
+    """Copy a request body to an anonymous temp file in fixed-size chunks"""
+    tmp = tempfile.TemporaryFile()
+    shutil.copyfileobj(stream, tmp, COPY_CHUNK_SIZE)
+    tmp.seek(0)
+    return tmp
+
+
+def iter_zip_entries(fileobj):
+    """
+    Yield (name, loader) for each report in a ZIP archive.
+
+    The loader reads the entry on demand, so only the entries currently being
+    analyzed are ever held in memory. Like a direct upload, an entry is
+    accepted by its content rather than its extension, and its filename is
+    given the extension of the kind it actually is.
+    """
+    # Not closed here: entries are still being read by worker threads after the
+    # listing is exhausted. The archive holds no resources beyond ``fileobj``,
+    # which the caller closes once every result has been streamed.
+    archive = zipfile.ZipFile(fileobj)
+
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+
+        name = info.filename
+        basename = os.path.basename(name)
+        if not basename or basename.startswith('.') or name.startswith('__MACOSX/'):
+            continue
+
+        if '.' not in basename or basename.rsplit('.', 1)[1].lower() not in BULK_EXTENSIONS:
+            yield name, _failing_loader('Unsupported file type')
+            continue
+
+        if info.file_size > BULK_MAX_ENTRY_SIZE:
+            yield name, _failing_loader('Entry exceeds the maximum report size')
+            continue
+
+        yield name, _zip_loader(archive, info)
+
+
+def _zip_loader(archive, info):
+    def load():
+        with archive.open(info) as entry:
+            # Guard against archives that under-report the uncompressed size
+            data = entry.read(BULK_MAX_ENTRY_SIZE + 1)
+        if len(data) > BULK_MAX_ENTRY_SIZE:
+            raise BulkEntryError('Entry exceeds the maximum report size')
+
+        if not data:
+            raise BulkEntryError('Entry is empty')
+        kind = content_kind(data)
+        if kind not in REPORT_KINDS:
+            found = KIND_NAMES[kind] if kind else 'unrecognized content'
+            raise BulkEntryError(f'Invalid file type ({found})')
+
+        base, _ = os.path.splitext(os.path.basename(info.filename))
+        return {'filename': f'{base or "report"}.{kind}', 'data': data}
+    return load
+
+
+def _failing_loader(message):
+    def load():
+        raise BulkEntryError(message)
+    return load
+
+
+def iter_ndjson_entries(stream):
+    """
+    Yield (name, loader) for each line of an NDJSON stream of text reports.
+
+    Each line is an object with a "text" field and an optional "id". Lines are
+    read one at a time straight from the request stream. JSON text sequences
+    (application/json-seq) are read the same way, minus each record's leading
+    record separator.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(BULK_MAX_ENTRY_SIZE + 1)
+        if not line:
+            break
+
+        line_number += 1
+
+        if len(line) > BULK_MAX_ENTRY_SIZE:
+            # Skip the rest of an oversized line before reporting it
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(COPY_CHUNK_SIZE)
+            yield str(line_number), _failing_loader('Line exceeds the maximum report size')
+            continue
+
+        line = line.lstrip(RECORD_SEPARATOR)
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield str(line_number), _failing_loader('Invalid JSON')
+            continue
+
+        if not isinstance(record, dict) or not isinstance(record.get('text'), str):
+            yield str(line_number), _failing_loader('Each line must be an object with a "text" field')
+            continue
+
+        name = str(record.get('id', line_number))
+        yield name, _text_loader(record['text'])
+
+
+def _text_loader(text):
+    def load():
+        return {'text': text}
+    return load
+
+
+def stream_results(entries, process, workers=BULK_WORKERS):
+    """
+    Run process(name, loader) over entries on a small thread pool and yield
+    each result as soon as it finishes.
+
+    At most ``workers * 2`` entries are in flight, so memory stays bounded no
+    matter how many entries the archive or stream contains.
+    """
+    max_in_flight = max(1, workers * 2)
+    entries = iter(entries)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = set()
+        exhausted = False
+
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    name, loader = next(entries)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(process, name, loader))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import time
+
+CHAT_DB = os.environ.get('CHAT_DB', 'chat.db')
+
+# Upper bound on the size of the history part of each chatbot prompt
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', 1200))
+
+# Messages (user + assistant) kept verbatim; older ones are folded into the summary
+CHAT_RECENT_MESSAGES = int(os.environ.get('CHAT_RECENT_MESSAGES', 6))
+
+# Fold messages into the summary in batches so it isn't rewritten every turn
+CHAT_SUMMARY_BATCH = int(os.environ.get('CHAT_SUMMARY_BATCH', 4))
+
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.environ.get('CHAT_SUMMARY_TOKEN_BUDGET', 250))
+
+# Messages kept per user for /api/chatbot/history
+CHAT_HISTORY_KEEP = int(os.environ.get('CHAT_HISTORY_KEEP', 200))
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English text)"""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text, max_tokens, keep='end'):
+    """Cut text to roughly max_tokens, keeping its start or its end"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    if keep == 'end':
+        return '...' + text[-max_chars:]
+    return text[:max_chars] + '...'
+
+
+class ChatMemory:
+    """
+    Per-user chatbot history in SQLite with a bounded prompt footprint.
+
+    Recent messages are kept verbatim; older ones are folded in batches into a
+    rolling summary, so the history sent with each prompt never exceeds
+    CHAT_HISTORY_TOKEN_BUDGET however long the conversation gets.
+    """
+
+    def __init__(self, db_path=CHAT_DB):
+        self.db_path = db_path
+        self.init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                prompt_tokens INTEGER,
+                latency_ms INTEGER,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages (user_id, id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                user_id INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL,
+                covered_message_id INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _summary_row(self, conn, user_id):
+        row = conn.execute(
+            'SELECT summary, covered_message_id FROM chat_summaries WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return (row['summary'], row['covered_message_id']) if row else ('', 0)
+
+    def load_context(self, user_id, token_budget=CHAT_HISTORY_TOKEN_BUDGET):
+        """
+        History to send with the next prompt: (summary, recent messages).
+
+        Recent messages are those not yet folded into the summary, newest
+        first until the budget left after the summary is used up, returned in
+        chronological order as dicts with 'role' and 'content'.
+        """
+        conn = self._connect()
+        summary, covered_id = self._summary_row(conn, user_id)
+        rows = conn.execute(
+            'SELECT role, content, tokens FROM chat_messages WHERE user_id = ? AND id > ? '
+            'ORDER BY id DESC LIMIT ?',
+            (user_id, covered_id, CHAT_RECENT_MESSAGES + CHAT_SUMMARY_BATCH)
+        ).fetchall()
+        conn.close()
+
+        remaining = token_budget - estimate_tokens(summary)
+        recent = []
+        for row in rows:
+            if row['tokens'] > remaining:
+                break
+            recent.append({'role': row['role'], 'content': row['content']})
+            remaining -= row['tokens']
+
+        recent.reverse()
+        return summary, recent
+
+    def record_turn(self, user_id, user_message, reply, prompt_tokens, latency_ms):
+        """Store one question/answer pair with the prompt size and latency of the answer"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            'INSERT INTO chat_messages (user_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)',
+            (user_id, 'user', user_message, estimate_tokens(user_message), now)
+        )
+        conn.execute(
+            'INSERT INTO chat_messages (user_id, role, content, tokens, prompt_tokens, latency_ms, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (user_id, 'assistant', reply, estimate_tokens(reply), prompt_tokens, latency_ms, now)
+        )
+
+        # Drop messages that are both summarized and past the display window
+        _, covered_id = self._summary_row(conn, user_id)
+        conn.execute(
+            'DELETE FROM chat_messages WHERE user_id = ? AND id <= ? AND id NOT IN '
+            '(SELECT id FROM chat_messages WHERE user_id = ? ORDER BY id DESC LIMIT ?)',
+            (user_id, covered_id, user_id, CHAT_HISTORY_KEEP)
+        )
+        conn.commit()
+        conn.close()
+
+    def messages_to_summarize(self, user_id):
+        """
+        Oldest unsummarized messages once more than CHAT_RECENT_MESSAGES +
+        CHAT_SUMMARY_BATCH have piled up, else an empty list.
+        """
+        conn = self._connect()
+        summary, covered_id = self._summary_row(conn, user_id)
+        rows = conn.execute(
+            'SELECT id, role, content FROM chat_messages WHERE user_id = ? AND id > ? ORDER BY id',
+            (user_id, covered_id)
+        ).fetchall()
+        conn.close()
+
+        if len(rows) <= CHAT_RECENT_MESSAGES + CHAT_SUMMARY_BATCH:
+            return summary, []
+
+        return summary, [dict(row) for row in rows[:len(rows) - CHAT_RECENT_MESSAGES]]
+
+    def save_summary(self, user_id, summary, covered_message_id):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO chat_summaries (user_id, summary, covered_message_id, updated_at) '
+            'VALUES (?, ?, ?, ?)',
+            (user_id, truncate_to_tokens(summary, CHAT_SUMMARY_TOKEN_BUDGET), covered_message_id, time.time())
+        )
+        conn.commit()
+        conn.close()
+
+    def history(self, user_id, limit=50):
+        """Most recent messages for display, oldest first"""
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT role, content, prompt_tokens, latency_ms, created_at FROM chat_messages '
+            'WHERE user_id = ? ORDER BY id DESC LIMIT ?',
+            (user_id, limit)
+        ).fetchall()
+        summary, _ = self._summary_row(conn, user_id)
+        conn.close()
+        return summary, [dict(row) for row in reversed(rows)]
+
+    def clear(self, user_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM chat_messages WHERE user_id = ?', (user_id,))
+        conn.execute('DELETE FROM chat_summaries WHERE user_id = ?', (user_id,))
+        conn.commit()
+        conn.close()
@@ -1,25 +1,15 @@
 import google.generativeai as genai
+from utils.concurrency import gemini_transport, simulate_llm_latency
 
 GEMINI_API_KEY = "YOUR_GEMINI_API_KEY_HERE"
 
 def initialize_gemini():
     if GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
         return None
-    genai.configure(api_key=GEMINI_API_KEY)
+    genai.configure(api_key=GEMINI_API_KEY, transport=gemini_transport())
     return genai.GenerativeModel('gemini-pro')
 
-def get_chatbot_response(user_message, report_context=None):
-    """
-    Generate chatbot response based on user query and medical report context
-    """
-    try:
-        model = initialize_gemini()
-        
-        if model is None:
-            return get_default_chatbot_response(user_message)
-        
-        # Build context-aware prompt
-        prompt = f"""You are a friendly and empathetic medical assistant chatbot. 
+CHATBOT_PREAMBLE = """You are a friendly and empathetic medical assistant chatbot. 
 Your role is to help patients understand their medical reports and answer health-related questions.
 
 IMPORTANT GUIDELINES:
@@ -30,18 +20,61 @@ IMPORTANT GUIDELINES:
 - Be honest if you don't have enough information
 
 """
-        
-        if report_context:
-            prompt += f"""
+
+def build_prompt_prefix(report_context=None):
+    """Static part of every prompt: instructions plus the patient's report"""
+    prefix = CHATBOT_PREAMBLE
+    
+    if report_context:
+        prefix += f"""
 PATIENT'S MEDICAL REPORT CONTEXT:
 {report_context}
 
 """
-        
+    
+    return prefix
+
+def build_chat_prompt(user_message, prefix, summary=None, recent_messages=None):
+    """Full prompt: cached prefix, conversation so far, then the new question"""
+    prompt = prefix
+    
+    if summary:
         prompt += f"""
+SUMMARY OF THE EARLIER CONVERSATION:
+{summary}
+
+"""
+    
+    if recent_messages:
+        prompt += "\nRECENT CONVERSATION:\n"
+        for message in recent_messages:
+            speaker = 'Patient' if message['role'] == 'user' else 'Assistant'
+            prompt += f"{speaker}: {message['content']}\n"
+        prompt += "\n"
+    
+    prompt += f"""
 PATIENT'S QUESTION: {user_message}
 
 Please provide a helpful, empathetic response. Keep it concise (2-3 sentences) unless more detail is needed."""
+    
+    return prompt
+
+def get_chatbot_response(user_message, report_context=None, prompt=None):
+    """
+    Generate chatbot response based on user query and medical report context.
+    
+    A prompt already assembled with build_chat_prompt (e.g. with conversation
+    history) can be passed instead of report_context.
+    """
+    try:
+        model = initialize_gemini()
+        
+        if model is None:
+            simulate_llm_latency()
+            return get_default_chatbot_response(user_message)
+        
+        if prompt is None:
+            prompt = build_chat_prompt(user_message, build_prompt_prefix(report_context))
         
         response = model.generate_content(prompt)
         return response.text
@@ -50,6 +83,37 @@ Please provide a helpful, empathetic response. Keep it concise (2-3 sentences) u
         print(f"Chatbot Error: {str(e)}")
         return get_default_chatbot_response(user_message)
 
+def summarize_conversation(previous_summary, messages):
+    """
+    Fold older chat messages into the running conversation summary.
+    
+    Uses Gemini when configured; otherwise keeps the patient's questions,
+    which is what later answers most often need to refer back to.
+    """
+    transcript = "\n".join(
+        f"{'Patient' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+    )
+    
+    try:
+        model = initialize_gemini()
+        
+        if model is not None:
+            prompt = f"""Summarize this conversation between a patient and a medical assistant chatbot in at most 5 short bullet points. Keep the patient's concerns, symptoms mentioned, and advice already given.
+
+EXISTING SUMMARY:
+{previous_summary or 'None'}
+
+NEW MESSAGES:
+{transcript}"""
+            response = model.generate_content(prompt)
+            return response.text
+    
+    except Exception as e:
+        print(f"Chat summary error: {str(e)}")
+    
+    questions = [f"- Patient asked: {m['content'][:150]}" for m in messages if m['role'] == 'user']
+    return "\n".join(filter(None, [previous_summary] + questions))
+
 def get_default_chatbot_response(user_message):
     """Fallback responses when Gemini API is not available"""
     user_message_lower = user_message.lower()
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+# Threads used for CPU-bound work (OCR, PDF parsing, model prediction) when
+# running under the cooperative gevent worker
+CPU_EXECUTOR_THREADS = int(os.environ.get('CPU_EXECUTOR_THREADS', os.cpu_count() or 2))
+
+# Artificial LLM latency in seconds, only for load testing without an API key
+LLM_SIMULATED_LATENCY = float(os.environ.get('LLM_SIMULATED_LATENCY', 0))
+
+
+def is_cooperative():
+    """True when running under gevent with the standard library monkey-patched"""
+    if 'gevent' not in sys.modules:
+        return False
+    try:
+        from gevent import monkey
+        return monkey.is_module_patched('socket')
+    except ImportError:
+        return False
+
+
+def process_alive(pid):
+    """True if a process with this pid exists (on this host)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Run CPU-bound work without stalling other requests.
+
+    Under the gevent worker every request is a greenlet on one OS thread, so a
+    long OCR or prediction call would freeze all of them; the work is handed to
+    gevent's native thread pool and only this greenlet waits for it. Under the
+    default sync/threaded workers each request already has its own thread and
+    the call runs inline.
+    """
+    if not is_cooperative():
+        return fn(*args, **kwargs)
+
+    import gevent
+    hub = gevent.get_hub()
+    if hub.threadpool.maxsize < CPU_EXECUTOR_THREADS:
+        hub.threadpool.maxsize = CPU_EXECUTOR_THREADS
+    return hub.threadpool.apply(fn, args, kwargs)
+
+
+def gemini_transport():
+    """
+    Transport for the Gemini client.
+
+    The default gRPC transport blocks the whole process under gevent; the REST
+    transport goes through monkey-patched sockets, so a request waiting on the
+    LLM yields to the others. GEMINI_TRANSPORT overrides the choice.
+    """
+    transport = os.environ.get('GEMINI_TRANSPORT')
+    if transport:
+        return transport
+    return 'rest' if is_cooperative() else None
+
+
+def simulate_llm_latency():
+    """Sleep for LLM_SIMULATED_LATENCY seconds (cooperatively under gevent)"""
+    if LLM_SIMULATED_LATENCY > 0:
+        time.sleep(LLM_SIMULATED_LATENCY)
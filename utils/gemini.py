@@ -1,4 +1,5 @@
 import google.generativeai as genai
+from utils.concurrency import gemini_transport, simulate_llm_latency
 import os
 
 GEMINI_API_KEY = "YOUR_GEMINI_API_KEY_HERE"
@@ -6,7 +7,7 @@ GEMINI_API_KEY = "YOUR_GEMINI_API_KEY_HERE"
 def initialize_gemini():
     if GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
         return None
-    genai.configure(api_key=GEMINI_API_KEY)
+    genai.configure(api_key=GEMINI_API_KEY, transport=gemini_transport())
     return genai.GenerativeModel('gemini-pro')
 
 def generate_explanation(values, risk_level):
@@ -14,6 +15,7 @@ def generate_explanation(values, risk_level):
         model = initialize_gemini()
         
         if model is None:
+            simulate_llm_latency()
             return get_default_explanation(values, risk_level)
         
         prompt = f"""You are a medical assistant. A machine learning model has predicted a {risk_level} health risk based on the following medical values:
@@ -0,0 +1,204 @@
+"""
+Missing-value imputation for the risk model from each user's own history.
+
+CLI (fill the cache from reports analyzed before it existed):
+    python -m utils.imputation rebuild [--reports-db reports.db] [--db reports.db]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from utils.model_registry import FEATURES, ML_DEFAULTS
+from utils.report_store import REPORTS_DB, ReportStore
+
+IMPUTATION_DB = os.environ.get('IMPUTATION_DB', REPORTS_DB)
+
+# Most recent values kept per user and analyte; the imputed value is their median
+IMPUTATION_HISTORY = int(os.environ.get('IMPUTATION_HISTORY', 5))
+
+# Values older than this are not used for imputation
+IMPUTATION_MAX_AGE_DAYS = float(os.environ.get('IMPUTATION_MAX_AGE_DAYS', 365))
+
+# Cohort medians are only used once the population has this many values
+IMPUTATION_MIN_COHORT = int(os.environ.get('IMPUTATION_MIN_COHORT', 20))
+
+IMPUTATION_SOURCES = ('history', 'cohort', 'default')
+
+# Report sources that may hold other patients' reports under one account (a
+# clinic's bulk or multi-file upload): they are imputed without history and
+# never added to it
+SHARED_ACCOUNT_SOURCES = ('bulk', 'multiple')
+
+
+class Imputer:
+    """
+    Fills analytes missing from a report before it goes to the model: the
+    median of the user's recent values, else the population median, else
+    ML_DEFAULTS.
+
+    Each user's recent values are kept precomputed in one row per user and
+    updated as reports are recorded, so imputing is a single primary-key
+    lookup rather than a scan of the report history. Cohort medians come
+    from the population sketches and are cached until those are reloaded.
+    """
+
+    def __init__(self, population=None, db_path=IMPUTATION_DB, history=IMPUTATION_HISTORY,
+                 max_age_days=IMPUTATION_MAX_AGE_DAYS, min_cohort=IMPUTATION_MIN_COHORT):
+        self.population = population
+        self.db_path = db_path
+        self.history = history
+        self.max_age = max_age_days * 86400
+        self.min_cohort = min_cohort
+        self._cohort = {}
+        self._cohort_loaded_at = None
+        self.init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_recent_values (
+                user_id INTEGER PRIMARY KEY,
+                recent TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _merge(self, recent, values, when):
+        for analyte in FEATURES:
+            value = values.get(analyte)
+            if value is None:
+                continue
+            entries = recent.setdefault(analyte, [])
+            entries.append([float(value), when])
+            del entries[:-self.history]
+        return recent
+
+    def update(self, user_id, values, when=None):
+        """Add one report's values to the user's recent values"""
+        if user_id is None or all(values.get(analyte) is None for analyte in FEATURES):
+            return
+        when = when or time.time()
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT recent FROM user_recent_values WHERE user_id = ?', (user_id,)).fetchone()
+            recent = self._merge(json.loads(row[0]) if row else {}, values, when)
+            conn.execute(
+                'INSERT OR REPLACE INTO user_recent_values (user_id, recent, updated_at) VALUES (?, ?, ?)',
+                (user_id, json.dumps(recent), time.time())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def recent(self, user_id):
+        """analyte -> [[value, recorded_at], ...], oldest first"""
+        if user_id is None:
+            return {}
+        conn = self._connect()
+        row = conn.execute('SELECT recent FROM user_recent_values WHERE user_id = ?', (user_id,)).fetchone()
+        conn.close()
+        return json.loads(row[0]) if row else {}
+
+    def cohort_median(self, analyte):
+        if self.population is None:
+            return None
+        if self._cohort_loaded_at != self.population.loaded_at:
+            self._cohort = {}
+            self._cohort_loaded_at = self.population.loaded_at
+
+        if analyte not in self._cohort:
+            sketch = self.population.sketch(analyte)
+            median = sketch.quantile(0.5) if sketch.count >= self.min_cohort else None
+            self._cohort[analyte] = round(median, 2) if median is not None else None
+        return self._cohort[analyte]
+
+    def impute(self, values, user_id=None, now=None):
+        """
+        Model input for a report: returns (filled values, imputed), where
+        imputed maps each filled analyte to its value and source.
+        """
+        filled = {}
+        imputed = {}
+        recent = None
+        cutoff = (now or time.time()) - self.max_age
+
+        for analyte in FEATURES:
+            value = values.get(analyte)
+            if value is not None:
+                filled[analyte] = value
+                continue
+
+            if recent is None:
+                recent = self.recent(user_id)
+            history = [entry[0] for entry in recent.get(analyte, []) if entry[1] >= cutoff]
+            if history:
+                value, source = round(statistics.median(history), 2), 'history'
+            else:
+                value, source = self.cohort_median(analyte), 'cohort'
+                if value is None:
+                    value, source = ML_DEFAULTS[analyte], 'default'
+
+            filled[analyte] = value
+            imputed[analyte] = {'value': value, 'source': source}
+
+        return filled, imputed
+
+    def rebuild(self, report_store):
+        """Recompute every user's recent values from the stored reports; returns the number of users"""
+        recent = {}
+        for rows in report_store.iter_chunks():
+            for _, user_id, source, hemoglobin, blood_sugar, cholesterol, _, _, created_at, *_ in rows:
+                if user_id is None or source in SHARED_ACCOUNT_SOURCES:
+                    continue
+                values = {'hemoglobin': hemoglobin, 'blood_sugar': blood_sugar, 'cholesterol': cholesterol}
+                when = datetime.fromisoformat(created_at).timestamp()
+                self._merge(recent.setdefault(user_id, {}), values, when)
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM user_recent_values')
+            conn.executemany(
+                'INSERT INTO user_recent_values (user_id, recent, updated_at) VALUES (?, ?, ?)',
+                [(user_id, json.dumps(entries), time.time()) for user_id, entries in recent.items() if entries]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return len(recent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = commands.add_parser('rebuild', help='recompute every user\'s recent values from the report history')
+    rebuild.add_argument('--reports-db', default=REPORTS_DB)
+    rebuild.add_argument('--db', default=IMPUTATION_DB)
+
+    args = parser.parse_args()
+    users = Imputer(db_path=args.db).rebuild(ReportStore(args.reports_db))
+    print(f'Rebuilt recent values for {users} users', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
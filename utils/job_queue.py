@@ -0,0 +1,332 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+JOBS_DB = os.environ.get('JOBS_DB', 'jobs.db')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+# How long an idle worker sleeps before re-checking the queue. Submissions in
+# the same process wake workers immediately; this only matters for jobs that
+# were enqueued by another gunicorn worker process.
+POLL_INTERVAL = 1.0
+
+# A job left in 'running' for longer than this is assumed to belong to a
+# worker that died, and is put back on the queue.
+STALE_JOB_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 600))
+
+# Finished jobs are kept this long so clients can still collect the result.
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 24 * 60 * 60))
+
+STATS_WINDOW_SECONDS = 15 * 60
+
+
+class JobQueue:
+    """
+    Durable work queue backed by SQLite with a pool of worker threads.
+
+    Jobs survive a restart: anything still queued is picked up again when the
+    next worker starts, and jobs stuck in 'running' are requeued once stale.
+    Workers take the highest-priority queued job first (the kind's priority
+    from register()), oldest first within a priority.
+    """
+
+    def __init__(self, db_path=JOBS_DB):
+        self.db_path = db_path
+        self._handlers = {}
+        self._priorities = {}
+        self._workers = []
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._last_purge = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                user_id INTEGER,
+                status TEXT NOT NULL,
+                payload TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                priority INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        ''')
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'priority' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_priority ON jobs (status, priority, created_at)')
+        conn.commit()
+        conn.close()
+
+    def register(self, kind, handler, priority=0):
+        """
+        Register the function that runs jobs of the given kind. Jobs of a
+        higher-priority kind are run before any queued lower-priority job.
+        """
+        self._handlers[kind] = handler
+        self._priorities[kind] = priority
+
+    def submit(self, kind, payload, user_id=None, job_id=None):
+        """Enqueue a job and return its id immediately"""
+        job_id = job_id or uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute(
+            'INSERT INTO jobs (id, kind, user_id, status, payload, priority, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, user_id, 'queued', json.dumps(payload), self._priorities.get(kind, 0), time.time())
+        )
+        conn.commit()
+        conn.close()
+
+        with self._wakeup:
+            self._wakeup.notify()
+
+        return job_id
+
+    def submit_once(self, kind, payload, job_id, user_id=None):
+        """
+        Enqueue a job under a fixed id unless a job with that id is still
+        queued or running; returns the id, or None if nothing was enqueued.
+        A finished job with the id is replaced.
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is not None and row['status'] in ('queued', 'running'):
+                conn.rollback()
+                return None
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (id, kind, user_id, status, payload, priority, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, user_id, 'queued', json.dumps(payload), self._priorities.get(kind, 0), time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._wakeup:
+            self._wakeup.notify()
+
+        return job_id
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if it does not exist"""
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.close()
+
+        if row is None:
+            return None
+
+        job = {
+            'id': row['id'],
+            'kind': row['kind'],
+            'user_id': row['user_id'],
+            'status': row['status'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at']
+        }
+
+        if row['status'] == 'queued':
+            job['position'] = self._queue_position(row['priority'], row['created_at'])
+
+        return job
+
+    def _queue_position(self, priority, created_at):
+        conn = self._connect()
+        count = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' "
+            'AND (priority > ? OR (priority = ? AND created_at < ?))', (priority, priority, created_at)
+        ).fetchone()[0]
+        conn.close()
+        return count + 1
+
+    def _claim_next(self):
+        """Atomically move the oldest queued job to 'running' and return it"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), row['id'])
+            )
+            conn.commit()
+            return dict(row)
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _run(self, job):
+        handler = self._handlers.get(job['kind'])
+        if handler is None:
+            self._finish(job['id'], 'failed', error=f"No handler registered for job kind '{job['kind']}'")
+            return
+
+        try:
+            result = handler(json.loads(job['payload']))
+            self._finish(job['id'], 'done', result=result)
+        except Exception as e:
+            print(f"Job {job['id']} failed:")
+            print(traceback.format_exc())
+            self._finish(job['id'], 'failed', error=str(e))
+
+    def requeue_stale(self):
+        """Put jobs whose worker disappeared back on the queue"""
+        conn = self._connect()
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running' AND started_at < ?",
+            (time.time() - STALE_JOB_SECONDS,)
+        )
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+
+    def purge_expired(self):
+        """Delete finished jobs older than the retention period"""
+        conn = self._connect()
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - JOB_RETENTION_SECONDS,)
+        )
+        conn.commit()
+        conn.close()
+
+    def _housekeeping(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        try:
+            self.requeue_stale()
+            self.purge_expired()
+        except sqlite3.Error as e:
+            print(f"Job queue housekeeping error: {str(e)}")
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim_next()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {str(e)}")
+                job = None
+
+            if job is None:
+                self._housekeeping()
+                with self._wakeup:
+                    self._wakeup.wait(POLL_INTERVAL)
+                continue
+
+            try:
+                self._run(job)
+            except Exception:
+                # Recording the outcome failed (e.g. the database stayed locked);
+                # the job is requeued once stale, and this worker carries on
+                print(f"Job queue error finishing job {job['id']}:")
+                print(traceback.format_exc())
+
+    def start(self, num_workers=JOB_WORKERS):
+        """Start the background worker threads (once per process)"""
+        if self._workers:
+            return
+
+        self.init_db()
+        self.requeue_stale()
+
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def stats(self):
+        """Queue depth, wait time and job duration over the recent window"""
+        now = time.time()
+        conn = self._connect()
+
+        counts = {row['status']: row['n'] for row in conn.execute(
+            'SELECT status, COUNT(*) AS n FROM jobs GROUP BY status'
+        )}
+
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+
+        recent = conn.execute(
+            "SELECT started_at - created_at AS wait, finished_at - started_at AS duration, status "
+            "FROM jobs WHERE status IN ('done', 'failed') AND finished_at >= ? "
+            "ORDER BY finished_at DESC LIMIT 1000",
+            (now - STATS_WINDOW_SECONDS,)
+        ).fetchall()
+        conn.close()
+
+        waits = sorted(row['wait'] for row in recent)
+        durations = sorted(row['duration'] for row in recent)
+
+        return {
+            'queue_depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'workers': len(self._workers),
+            'oldest_queued_age_seconds': round(now - oldest, 3) if oldest else 0,
+            'window_seconds': STATS_WINDOW_SECONDS,
+            'completed': sum(1 for row in recent if row['status'] == 'done'),
+            'failed': sum(1 for row in recent if row['status'] == 'failed'),
+            'wait_seconds': _summarize(waits),
+            'duration_seconds': _summarize(durations)
+        }
+
+
+def _summarize(sorted_values):
+    if not sorted_values:
+        return {'avg': 0, 'p50': 0, 'p95': 0, 'max': 0}
+
+    def pick(q):
+        return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))], 3)
+
+    return {
+        'avg': round(sum(sorted_values) / len(sorted_values), 3),
+        'p50': pick(0.5),
+        'p95': pick(0.95),
+        'max': round(sorted_values[-1], 3)
+    }
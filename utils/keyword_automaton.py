@@ -0,0 +1,100 @@
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton for finding many keywords in one pass over a text.
+
+    Scanning costs O(len(text) + number of matches) regardless of how many
+    keywords were added, so adding analytes to the catalog does not slow down
+    parsing.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+
+    def add(self, keyword, payload):
+        """Add a keyword; payload is returned with every match of it"""
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((len(keyword), payload))
+        self._built = False
+
+    def build(self):
+        """Compute failure links; called automatically before the first scan"""
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+        self._built = True
+
+    def iter_matches(self, text):
+        """Yield (start, end, payload) for every keyword occurrence in text"""
+        if not self._built:
+            self.build()
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            for length, payload in output[node]:
+                yield index + 1 - length, index + 1, payload
+
+    def find_words(self, text):
+        """
+        Leftmost-longest whole-word matches as a list of (start, end, payload).
+
+        A match must not be glued to letters or digits on either side, so "hb"
+        is not found inside "hba1c". Overlapping matches are resolved in
+        favour of the one that starts first, then the longest, so "hdl
+        cholesterol" wins over "cholesterol".
+        """
+        candidates = []
+        length = len(text)
+        for start, end, payload in self.iter_matches(text):
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if end < length and text[end].isalnum():
+                continue
+            candidates.append((start, -end, payload))
+
+        candidates.sort(key=lambda match: (match[0], match[1]))
+
+        matches = []
+        last_end = -1
+        for start, negative_end, payload in candidates:
+            if start < last_end:
+                continue
+            matches.append((start, -negative_end, payload))
+            last_end = -negative_end
+
+        return matches
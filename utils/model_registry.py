@@ -0,0 +1,308 @@
+import hashlib
+import os
+import pickle
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+MODEL_PATH = os.environ.get('MODEL_PATH', 'model/risk_model.pkl')
+
+# How often each worker checks the model file for a new version; 0 disables
+MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 30))
+
+# Optional candidate model scored alongside the live one on sampled traffic
+SHADOW_MODEL_PATH = os.environ.get('SHADOW_MODEL_PATH', '')
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.1))
+
+# Shadow predictions waiting to run beyond this are dropped, not queued
+SHADOW_MAX_PENDING = 100
+
+FEATURES = ['hemoglobin', 'blood_sugar', 'cholesterol']
+
+# Values used for the ML model when an analyte is missing from the report
+ML_DEFAULTS = {
+    'hemoglobin': 14.0,
+    'blood_sugar': 100.0,
+    'cholesterol': 190.0
+}
+
+RISK_LABELS = {'Low', 'Medium', 'High'}
+
+# Reports a new model must be able to score before it replaces the live one
+VALIDATION_ROWS = [
+    {'hemoglobin': 14.0, 'blood_sugar': 100.0, 'cholesterol': 190.0},
+    {'hemoglobin': 9.5, 'blood_sugar': 210.0, 'cholesterol': 260.0},
+    {'hemoglobin': 16.5, 'blood_sugar': 75.0, 'cholesterol': 150.0}
+]
+
+
+class ModelValidationError(Exception):
+    pass
+
+
+class LoadedModel:
+    """A model together with the version (content hash) it was loaded from"""
+
+    def __init__(self, model, path, version, mtime):
+        self.model = model
+        self.path = path
+        self.version = version
+        self.mtime = mtime
+        self.loaded_at = time.time()
+
+    def info(self):
+        return {
+            'version': self.version,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'file_modified_at': self.mtime
+        }
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+def load_model(path):
+    """Load and validate a pickled model; raises ModelValidationError if unusable"""
+    mtime, _ = _file_signature(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    version = hashlib.sha256(data).hexdigest()[:12]
+
+    try:
+        model = pickle.loads(data)
+    except Exception as e:
+        raise ModelValidationError(f'cannot unpickle {path}: {e}')
+
+    if not hasattr(model, 'predict'):
+        raise ModelValidationError(f'{path} has no predict()')
+
+    expected = getattr(model, 'feature_names_in_', None)
+    if expected is not None and list(expected) != FEATURES:
+        raise ModelValidationError(f'{path} expects features {list(expected)}, not {FEATURES}')
+
+    try:
+        predictions = model.predict(pd.DataFrame(VALIDATION_ROWS))
+    except Exception as e:
+        raise ModelValidationError(f'{path} failed on validation rows: {e}')
+
+    unknown = {str(p) for p in predictions} - RISK_LABELS
+    if unknown:
+        raise ModelValidationError(f'{path} predicts unknown risk levels {sorted(unknown)}')
+
+    return LoadedModel(model, path, version, mtime)
+
+
+class ShadowStats:
+    """Agreement and latency of the shadow model against the live one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.sampled = 0
+            self.agreed = 0
+            self.dropped = 0
+            self.errors = 0
+            self.live_seconds = 0.0
+            self.shadow_seconds = 0.0
+            self.disagreements = {}
+
+    def record(self, live_label, shadow_label, live_seconds, shadow_seconds):
+        with self._lock:
+            self.sampled += 1
+            self.live_seconds += live_seconds
+            self.shadow_seconds += shadow_seconds
+            if live_label == shadow_label:
+                self.agreed += 1
+            else:
+                key = f'{live_label}->{shadow_label}'
+                self.disagreements[key] = self.disagreements.get(key, 0) + 1
+
+    def record_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            sampled = self.sampled
+            return {
+                'sampled': sampled,
+                'agreed': self.agreed,
+                'agreement_rate': round(self.agreed / sampled, 4) if sampled else None,
+                'disagreements': dict(self.disagreements),
+                'avg_live_ms': round(self.live_seconds / sampled * 1000, 3) if sampled else None,
+                'avg_shadow_ms': round(self.shadow_seconds / sampled * 1000, 3) if sampled else None,
+                'dropped': self.dropped,
+                'errors': self.errors
+            }
+
+
+class ModelRegistry:
+    """
+    The live risk model, reloaded in the background when its file changes.
+
+    A watcher thread polls the file's mtime and size; on a change the new file
+    is hashed, unpickled and validated off the request path, then swapped in
+    with a single reference assignment. Requests take one reference per
+    prediction, so in-flight requests finish on the model they started with
+    and nothing waits on a reload. A file that fails validation is logged and
+    the previous model stays live.
+    """
+
+    def __init__(self, path=MODEL_PATH, shadow_path=SHADOW_MODEL_PATH,
+                 shadow_sample_rate=SHADOW_SAMPLE_RATE, reload_interval=MODEL_RELOAD_INTERVAL):
+        self.path = path
+        self.shadow_path = shadow_path or None
+        self.shadow_sample_rate = shadow_sample_rate
+        self.reload_interval = reload_interval
+
+        self._live = load_model(path)
+        self._shadow = None
+        self._signatures = {path: _file_signature(path)}
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stopping = threading.Event()
+        self._shadow_lock = threading.Lock()
+        self._shadow_executor = None
+        self._shadow_pending = 0
+
+        self.reloads = 0
+        self.reload_failures = 0
+        self.last_error = None
+        self.shadow_stats = ShadowStats()
+
+        if self.shadow_path:
+            self._load_shadow()
+
+    @property
+    def live(self):
+        return self._live
+
+    def _load_shadow(self):
+        try:
+            self._signatures[self.shadow_path] = _file_signature(self.shadow_path)
+            self._shadow = load_model(self.shadow_path)
+            self.shadow_stats.reset()
+        except (OSError, ModelValidationError) as e:
+            self._shadow = None
+            self.last_error = f'shadow: {e}'
+            print(f"Shadow model error: {str(e)}")
+
+    def _changed(self, path):
+        try:
+            signature = _file_signature(path)
+        except OSError:
+            return False
+        if signature == self._signatures.get(path):
+            return False
+        self._signatures[path] = signature
+        return True
+
+    def check_for_update(self):
+        """Reload the live and shadow models if their files changed; returns True on a swap"""
+        with self._reload_lock:
+            swapped = False
+
+            if self._changed(self.path):
+                try:
+                    candidate = load_model(self.path)
+                except (OSError, ModelValidationError) as e:
+                    self.reload_failures += 1
+                    self.last_error = str(e)
+                    print(f"Model reload rejected: {str(e)}")
+                else:
+                    if candidate.version != self._live.version:
+                        self._live = candidate
+                        self.reloads += 1
+                        self.last_error = None
+                        swapped = True
+                        print(f"Model reloaded: version {candidate.version}")
+
+            if self.shadow_path and self._changed(self.shadow_path):
+                self._load_shadow()
+
+            return swapped
+
+    def _watch(self):
+        while not self._stopping.wait(self.reload_interval):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                print(f"Model watcher error: {str(e)}")
+
+    def start(self):
+        """Start the background file watcher (once per process)"""
+        if self._watcher or self.reload_interval <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def predict(self, input_data):
+        """Predict with the live model; maybe also score the same input with the shadow model"""
+        live = self._live
+        started = time.perf_counter()
+        prediction = live.model.predict(input_data)
+        live_seconds = time.perf_counter() - started
+
+        shadow = self._shadow
+        if shadow is not None and random.random() < self.shadow_sample_rate:
+            self._submit_shadow(shadow, input_data, prediction, live_seconds)
+
+        return prediction
+
+    def _submit_shadow(self, shadow, input_data, live_prediction, live_seconds):
+        # Shadow scoring never adds latency to the request: it runs on its own
+        # thread and is skipped when that thread falls behind. Requests submit
+        # from many threads, so the pending count and the executor are only
+        # touched under _shadow_lock
+        with self._shadow_lock:
+            if self._shadow_pending >= SHADOW_MAX_PENDING:
+                self.shadow_stats.record_dropped()
+                return
+            if self._shadow_executor is None:
+                self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-shadow')
+            self._shadow_pending += 1
+            executor = self._shadow_executor
+
+        executor.submit(self._score_shadow, shadow, input_data, live_prediction, live_seconds)
+
+    def _score_shadow(self, shadow, input_data, live_prediction, live_seconds):
+        try:
+            started = time.perf_counter()
+            shadow_prediction = shadow.model.predict(input_data)
+            shadow_seconds = time.perf_counter() - started
+            for live_label, shadow_label in zip(live_prediction, shadow_prediction):
+                self.shadow_stats.record(str(live_label), str(shadow_label), live_seconds, shadow_seconds)
+        except Exception as e:
+            self.shadow_stats.record_error()
+            print(f"Shadow prediction error: {str(e)}")
+        finally:
+            with self._shadow_lock:
+                self._shadow_pending -= 1
+
+    def stats(self):
+        shadow = self._shadow
+        return {
+            'live': self._live.info(),
+            'reloads': self.reloads,
+            'reload_failures': self.reload_failures,
+            'last_error': self.last_error,
+            'reload_interval': self.reload_interval,
+            'shadow': dict(shadow.info(), sample_rate=self.shadow_sample_rate,
+                           **self.shadow_stats.snapshot()) if shadow else None
+        }
@@ -1,53 +1,151 @@
 import re
+from utils.analytes import ANALYTE_CATALOG, CORE_ANALYTES, normalize_unit
+from utils.keyword_automaton import KeywordAutomaton
+
+# Number (optionally after bracketed notes such as "(Hb) (g/L)" and a ':', '='
+# or '-') and an optional unit token, matched right after an analyte name
+VALUE_PATTERN = re.compile(
+    r'((?: ?\([^()]{0,30}\)){0,2}) ?[:=\-]? ?'
+    r'(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)'
+    r'(?: ?([^\s\d,;:()][^\s,;:()]*))?'
+)
+
+WHITESPACE = re.compile(r'\s+')
+BRACKETED = re.compile(r'\(([^()]*)\)')
+
+
+def build_analyte_matcher(catalog):
+    """Compile every alias in the catalog into one keyword automaton"""
+    automaton = KeywordAutomaton()
+    for analyte in catalog:
+        keywords = set()
+        for alias in analyte['aliases']:
+            alias = WHITESPACE.sub(' ', alias.lower().strip())
+            keywords.add(alias)
+            # Reports often drop the space ("bloodsugar", "totalcholesterol")
+            keywords.add(alias.replace(' ', ''))
+        for keyword in sorted(keywords):
+            automaton.add(keyword, analyte)
+    automaton.build()
+    return automaton
+
+
+_default_matcher = None
+
+
+def _get_default_matcher():
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = build_analyte_matcher(ANALYTE_CATALOG)
+    return _default_matcher
+
+
+def _looks_like_unit(token):
+    return bool(token) and any(char in token for char in '/%^')
+
+
+def _convert(analyte, value, unit):
+    """Convert a value to the analyte's canonical unit; only a printed unit is converted"""
+    return value * analyte.get('units', {}).get(unit, 1.0)
+
+
+def _assumed_unit(analyte, value):
+    """
+    For an unlabelled value outside the valid range, the one alternative unit
+    it would be plausible in (e.g. glucose 5.6 -> mmol/L), if any. This is a
+    hint only: the value is not converted, so validation still rejects it
+    (an unlabelled hemoglobin 4.5 may be a critical result, not g/L).
+    """
+    low, high = analyte['valid_range']
+    if low <= value <= high:
+        return None
+
+    candidates = [unit for unit, factor in analyte.get('units', {}).items()
+                  if factor != 1.0 and low <= value * factor <= high]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _flag(analyte, value):
+    low, high = analyte['valid_range']
+    if value < low or value > high:
+        return 'invalid'
+
+    normal_low, normal_high = analyte.get('normal_range') or (None, None)
+    if normal_low is not None and value < normal_low:
+        return 'low'
+    if normal_high is not None and value > normal_high:
+        return 'high'
+    return 'normal'
+
+
+def parse_lab_panel(text, matcher=None):
+    """
+    Find every catalog analyte in a report.
+
+    Returns a dict keyed by analyte key. Each entry has the value converted to
+    the canonical unit (when a unit is printed), the raw value and unit as
+    printed, and a flag: 'low', 'normal', 'high' or 'invalid' (outside the
+    plausible range). An unlabelled invalid value that would be plausible in
+    another unit names it in unit_assumed. The first occurrence of an analyte
+    that is followed by a number wins.
+    """
+    matcher = matcher or _get_default_matcher()
+    text_lower = WHITESPACE.sub(' ', text.lower())
+
+    panel = {}
+    for start, end, analyte in matcher.find_words(text_lower):
+        key = analyte['key']
+        if key in panel:
+            continue
+
+        match = VALUE_PATTERN.match(text_lower, end)
+        if not match:
+            continue
+
+        raw_value = float(match.group(2).replace(',', ''))
+
+        # A unit may be printed after the value or in brackets before it.
+        # Anything that does not look like a unit (usually the next word in
+        # the report) is ignored.
+        unit = ''
+        units = analyte.get('units', {})
+        for candidate in [match.group(3)] + BRACKETED.findall(match.group(1)):
+            candidate = normalize_unit(candidate)
+            if candidate in units:
+                unit = candidate
+                break
+            if not unit and _looks_like_unit(candidate):
+                unit = candidate
+
+        value = round(_convert(analyte, raw_value, unit), 2)
+
+        panel[key] = {
+            'name': analyte['name'],
+            'panel': analyte['panel'],
+            'value': value,
+            'unit': analyte['unit'],
+            'raw_value': raw_value,
+            'raw_unit': unit or None,
+            'unit_assumed': None if unit else _assumed_unit(analyte, raw_value),
+            'flag': _flag(analyte, value)
+        }
+
+    return panel
+
 
 def parse_medical_values(text):
+    panel = parse_lab_panel(text)
+
     values = {
         'hemoglobin': None,
         'blood_sugar': None,
         'cholesterol': None
     }
-    
-    text_lower = text.lower()
-    
-    hb_patterns = [
-        r'hemoglobin[:\s]+(\d+\.?\d*)',
-        r'hb[:\s]+(\d+\.?\d*)',
-        r'haemoglobin[:\s]+(\d+\.?\d*)',
-        r'hgb[:\s]+(\d+\.?\d*)'
-    ]
-    
-    for pattern in hb_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['hemoglobin'] = float(match.group(1))
-            break
-    
-    sugar_patterns = [
-        r'blood\s*sugar[:\s]+(\d+\.?\d*)',
-        r'glucose[:\s]+(\d+\.?\d*)',
-        r'fasting\s*glucose[:\s]+(\d+\.?\d*)',
-        r'fbs[:\s]+(\d+\.?\d*)',
-        r'blood\s*glucose[:\s]+(\d+\.?\d*)'
-    ]
-    
-    for pattern in sugar_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['blood_sugar'] = float(match.group(1))
-            break
-    
-    cholesterol_patterns = [
-        r'cholesterol[:\s]+(\d+\.?\d*)',
-        r'total\s*cholesterol[:\s]+(\d+\.?\d*)',
-        r'chol[:\s]+(\d+\.?\d*)'
-    ]
-    
-    for pattern in cholesterol_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['cholesterol'] = float(match.group(1))
-            break
-    
+
+    for key in CORE_ANALYTES:
+        if key in panel:
+            values[key] = panel[key]['value']
+
     return values
 
 def validate_values(values):
@@ -0,0 +1,175 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+import pytesseract
+from PIL import Image
+
+from utils.concurrency import is_cooperative
+
+# Pages beyond this are not read at all
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 50))
+
+# Wall-clock budget for one document; pages not reached in time are skipped
+PDF_TIME_BUDGET = float(os.environ.get('PDF_TIME_BUDGET', 60))
+
+# Documents with at least this many pages are split across a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 8))
+PDF_PROCESSES = int(os.environ.get('PDF_PROCESSES', os.cpu_count() or 2))
+
+# A page with less extractable text than this is treated as a scanned image
+MIN_TEXT_CHARS = 20
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver, not fork: the app process runs job, aggregates,
+            # model-watcher and warm-up threads, and a fork could copy a lock
+            # one of them holds (sqlite, stdout) into the child and deadlock it
+            _pool = ProcessPoolExecutor(max_workers=PDF_PROCESSES,
+                                        mp_context=multiprocessing.get_context('forkserver'))
+        return _pool
+
+
+def _reset_pool(pool):
+    """Stop a pool whose workers overran the time budget; the next document gets a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    # Still-running OCR would otherwise keep the processes busy and the next
+    # document would queue behind it
+    for process in list(getattr(pool, '_processes', {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ocr_page_images(page, deadline):
+    """OCR the images embedded in a page (a scanned page is one big image)"""
+    texts = []
+    for image_file in page.images:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            image = Image.open(io.BytesIO(image_file.data))
+            # Tesseract is killed if the image would take past the deadline
+            texts.append(pytesseract.image_to_string(image, timeout=remaining))
+        except Exception as e:
+            print(f"PDF OCR Error: {str(e)}")
+    return '\n'.join(text for text in texts if text)
+
+
+def _extract_page(page, number, deadline):
+    started = time.perf_counter()
+    text = page.extract_text() or ''
+    method = 'text'
+
+    if len(text.strip()) < MIN_TEXT_CHARS:
+        try:
+            ocr_text = _ocr_page_images(page, deadline)
+        except Exception as e:
+            print(f"PDF image extraction error on page {number}: {str(e)}")
+            ocr_text = ''
+        if len(ocr_text.strip()) > len(text.strip()):
+            text = ocr_text
+            method = 'ocr'
+
+    return {
+        'page': number,
+        'method': method,
+        'chars': len(text),
+        'seconds': round(time.perf_counter() - started, 4),
+        'text': text
+    }
+
+
+def _skipped(number):
+    return {'page': number, 'method': 'skipped', 'chars': 0, 'seconds': 0, 'text': ''}
+
+
+def _extract_page_range(filepath, numbers, deadline):
+    """Worker entry point: open the PDF and extract the given 1-based pages"""
+    reader = PyPDF2.PdfReader(filepath)
+    results = []
+    for number in numbers:
+        if time.time() >= deadline:
+            results.append(_skipped(number))
+            continue
+        results.append(_extract_page(reader.pages[number - 1], number, deadline))
+    return results
+
+
+def extract_pdf(filepath, max_pages=PDF_MAX_PAGES, time_budget=PDF_TIME_BUDGET):
+    """
+    Extract text from a PDF page by page.
+
+    Pages with a text layer use it directly; image-only (scanned) pages are
+    OCR'd. Large documents are split across a process pool. Returns the text
+    plus per-page timings and whether the page or time budget cut it short.
+    """
+    started = time.perf_counter()
+    deadline = time.time() + time_budget
+
+    reader = PyPDF2.PdfReader(filepath)
+    total_pages = len(reader.pages)
+    numbers = list(range(1, min(total_pages, max_pages) + 1))
+
+    # Process pools don't mix with gevent's patched threading; the gevent
+    # worker already runs this on a native thread via run_blocking
+    parallel = (len(numbers) >= PDF_PARALLEL_MIN_PAGES and PDF_PROCESSES > 1
+                and not is_cooperative())
+
+    if parallel:
+        chunk_size = max(1, -(-len(numbers) // PDF_PROCESSES))
+        chunks = [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+        pool = _get_pool()
+        futures = [(chunk, pool.submit(_extract_page_range, filepath, chunk, deadline))
+                   for chunk in chunks]
+
+        pages = []
+        overran = False
+        for chunk, future in futures:
+            try:
+                # Grace period for the page that was running at the deadline
+                pages.extend(future.result(timeout=max(0, deadline - time.time()) + 5))
+            except FutureTimeoutError:
+                overran = True
+                pages.extend(_skipped(number) for number in chunk)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); finish here instead
+                overran = True
+                pages.extend(_extract_page_range(filepath, chunk, deadline))
+        if overran:
+            _reset_pool(pool)
+    else:
+        pages = []
+        for number in numbers:
+            if time.time() >= deadline:
+                pages.append(_skipped(number))
+                continue
+            pages.append(_extract_page(reader.pages[number - 1], number, deadline))
+
+    texts = [page.pop('text') for page in pages]
+    text = '\n'.join(page_text for page_text in texts if page_text)
+
+    return {
+        'text': text,
+        'total_pages': total_pages,
+        'pages': pages,
+        'ocr_pages': sum(1 for page in pages if page['method'] == 'ocr'),
+        'truncated': total_pages > len(numbers),
+        'timed_out': any(page['method'] == 'skipped' for page in pages),
+        'parallel': parallel,
+        'seconds': round(time.perf_counter() - started, 4)
+    }
@@ -0,0 +1,188 @@
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from flask import g, has_app_context, make_response, request
+
+from utils.concurrency import is_cooperative
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Requests sending "X-Profile: <PROFILE_ADMIN_TOKEN>" are profiled; unset disables the header
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+
+# Fraction of requests profiled without the header (0 = never)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+
+# Oldest profiles are deleted beyond this many
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval from a helper thread
+    and counts identical stacks, giving collapsed ("folded") stacks that
+    flamegraph.pl, speedscope and similar tools read directly.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class stage:
+    """
+    Time a named stage of the current request if it is being profiled.
+
+    Usable as `with stage('extract'):`; a stage entered more than once (e.g.
+    per file) accumulates. Without an active profile (or outside a request,
+    e.g. in a job worker) it does nothing.
+    """
+
+    __slots__ = ('name', 'started', 'stages')
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = g.get('profile_stages') if has_app_context() else None
+
+    def __enter__(self):
+        if self.stages is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.stages is not None:
+            elapsed = time.perf_counter() - self.started
+            self.stages[self.name] = self.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+def _should_profile():
+    if PROFILE_ADMIN_TOKEN:
+        token = request.headers.get('X-Profile')
+        if token and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN):
+            return 'header'
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+
+def _prune(directory):
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:max(0, len(names) - PROFILE_MAX_FILES)]:
+        base = name[:-len('.json')]
+        for suffix in ('.json', '.folded'):
+            path = os.path.join(directory, base + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _write_profile(profile_id, request_id, endpoint, trigger, sampler, stages, duration, status):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+
+    if sampler is not None:
+        with open(base + '.folded', 'w') as f:
+            f.write(sampler.folded())
+
+    with open(base + '.json', 'w') as f:
+        json.dump({
+            'profile_id': profile_id,
+            'request_id': request_id,
+            'endpoint': endpoint,
+            'path': request.path,
+            'trigger': trigger,
+            'status': status,
+            'duration_seconds': round(duration, 4),
+            'samples': sampler.samples if sampler else 0,
+            'interval_seconds': sampler.interval if sampler else None,
+            'stages': {name: round(seconds, 4) for name, seconds in stages.items()}
+        }, f, indent=2)
+
+    _prune(PROFILE_DIR)
+
+
+def profiled(endpoint):
+    """
+    Run a view under the stack sampler when the request opts in (admin
+    header) or is picked by PROFILE_SAMPLE_RATE. Writes
+    <PROFILE_DIR>/<time>_<request id>_<endpoint>.folded with the collapsed
+    stacks and a .json next to it with timings per stage. Requests that are
+    not profiled pay only for the header check. Under the gevent worker all
+    greenlets share one thread, so only the stage timings are recorded.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            trigger = _should_profile()
+            if trigger is None:
+                return view(*args, **kwargs)
+
+            request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+            request_id = ''.join(ch for ch in request_id if ch.isalnum() or ch == '-')[:64] or uuid.uuid4().hex
+            profile_id = f'{time.strftime("%Y%m%dT%H%M%S")}_{request_id}_{endpoint}'
+
+            g.profile_stages = {}
+            sampler = None if is_cooperative() else StackSampler(threading.get_ident())
+            started = time.perf_counter()
+            if sampler is not None:
+                sampler.start()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                if sampler is not None:
+                    sampler.stop()
+            duration = time.perf_counter() - started
+
+            try:
+                _write_profile(profile_id, request_id, endpoint, trigger, sampler, g.profile_stages,
+                               duration, response.status_code)
+                response.headers['X-Profile-Id'] = profile_id
+            except OSError as e:
+                print(f"Profile write error: {str(e)}")
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,258 @@
+"""
+Report history store and streaming CSV/Parquet export.
+
+CLI:
+    python -m utils.report_store export --format csv --out reports.csv [--user-id N] [--since DATE] [--until DATE]
+    python -m utils.report_store export --format parquet --out reports.parquet
+
+Parquet export needs pyarrow (pip install pyarrow); CSV has no extra dependencies.
+"""
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+REPORTS_DB = os.environ.get('REPORTS_DB', 'reports.db')
+
+# Rows fetched from SQLite (and written as one CSV chunk or Parquet row group) at a time
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 5000))
+
+# imputed_* hold what the model was given for an analyte missing from the
+# report (see utils.imputation), so a rescore sees the same input
+IMPUTED_COLUMNS = ['imputed_hemoglobin', 'imputed_blood_sugar', 'imputed_cholesterol']
+
+EXPORT_COLUMNS = ['report_id', 'user_id', 'source', 'hemoglobin', 'blood_sugar', 'cholesterol',
+                  'risk_level', 'risk_score', 'created_at'] + IMPUTED_COLUMNS
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+
+def parquet_available():
+    return pa is not None
+
+
+class ReportStore:
+    """
+    Every analyzed report, one row each, for history export.
+
+    Reads page through the table by primary key (keyset pagination), so an
+    export holds one chunk in memory at a time and no long-lived read
+    transaction, however many rows it covers.
+    """
+
+    def __init__(self, db_path=REPORTS_DB):
+        self.db_path = db_path
+        self.init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS reports (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                source TEXT NOT NULL,
+                hemoglobin REAL,
+                blood_sugar REAL,
+                cholesterol REAL,
+                risk_level TEXT NOT NULL,
+                risk_score INTEGER,
+                created_at TEXT NOT NULL,
+                imputed_hemoglobin REAL,
+                imputed_blood_sugar REAL,
+                imputed_cholesterol REAL
+            )
+        ''')
+        # Databases created before imputed values were recorded
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(reports)')}
+        for column in IMPUTED_COLUMNS:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE reports ADD COLUMN {column} REAL')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_reports_user ON reports (user_id, id)')
+        conn.commit()
+        conn.close()
+
+    def add(self, user_id, values, risk_level, risk_score, source, created_at=None, imputed=None):
+        """Store one report; imputed is the analyte -> {'value', 'source'} map from Imputer.impute"""
+        imputed = imputed or {}
+        conn = self._connect()
+        cursor = conn.execute(
+            'INSERT INTO reports (user_id, source, hemoglobin, blood_sugar, cholesterol, risk_level, '
+            'risk_score, created_at, imputed_hemoglobin, imputed_blood_sugar, imputed_cholesterol) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (user_id, source, values.get('hemoglobin'), values.get('blood_sugar'), values.get('cholesterol'),
+             str(risk_level), risk_score, created_at or datetime.now().isoformat(),
+             *[imputed.get(column[len('imputed_'):], {}).get('value') for column in IMPUTED_COLUMNS])
+        )
+        conn.commit()
+        conn.close()
+        return cursor.lastrowid
+
+    def iter_chunks(self, user_id=None, since=None, until=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Yield lists of rows (tuples in EXPORT_COLUMNS order), oldest first"""
+        conditions = ['id > ?']
+        params = []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if since:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        if until:
+            conditions.append('created_at < ?')
+            params.append(until)
+
+        query = (f'SELECT {", ".join(["id"] + EXPORT_COLUMNS[1:])} FROM reports '
+                 f'WHERE {" AND ".join(conditions)} ORDER BY id LIMIT ?')
+
+        last_id = 0
+        while True:
+            conn = self._connect()
+            rows = conn.execute(query, [last_id] + params + [chunk_size]).fetchall()
+            conn.close()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
+
+
+def iter_csv(chunks):
+    """CSV text, header first, one piece per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the caller instead of keeping them"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_schema():
+    return pa.schema([
+        ('report_id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('source', pa.string()),
+        ('hemoglobin', pa.float64()),
+        ('blood_sugar', pa.float64()),
+        ('cholesterol', pa.float64()),
+        ('risk_level', pa.string()),
+        ('risk_score', pa.int64()),
+        ('created_at', pa.string()),
+        ('imputed_hemoglobin', pa.float64()),
+        ('imputed_blood_sugar', pa.float64()),
+        ('imputed_cholesterol', pa.float64())
+    ])
+
+
+def iter_parquet(chunks):
+    """Parquet file bytes, one row group per chunk, streamed as each group is written"""
+    if pa is None:
+        raise RuntimeError('Parquet export requires pyarrow (pip install pyarrow)')
+
+    schema = parquet_schema()
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            table = pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            )
+            writer.write_table(table)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_rows(chunks, fmt):
+    if fmt == 'parquet':
+        return iter_parquet(chunks)
+    return iter_csv(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='export reports to CSV or Parquet')
+    export.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+    export.add_argument('--out', required=True, help='output file, or - for stdout (CSV only)')
+    export.add_argument('--user-id', type=int, help='only this user\'s reports')
+    export.add_argument('--since', help='ISO date/time, inclusive')
+    export.add_argument('--until', help='ISO date/time, exclusive')
+    export.add_argument('--db', default=REPORTS_DB)
+    export.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    args = parser.parse_args()
+    if args.format == 'parquet' and not parquet_available():
+        parser.error('Parquet export requires pyarrow (pip install pyarrow)')
+    if args.out == '-' and args.format == 'parquet':
+        parser.error('Parquet output must go to a file')
+
+    store = ReportStore(args.db)
+    chunks = store.iter_chunks(args.user_id, args.since, args.until, args.chunk_size)
+
+    if args.out == '-':
+        for piece in iter_csv(chunks):
+            sys.stdout.write(piece)
+        return
+
+    mode, kwargs = ('wb', {}) if args.format == 'parquet' else ('w', {'newline': '', 'encoding': 'utf-8'})
+    with open(args.out, mode, **kwargs) as f:
+        for piece in export_rows(chunks, args.format):
+            f.write(piece)
+    print(f'Exported to {args.out}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+SESSIONS_DB = os.environ.get('SESSIONS_DB', 'sessions.db')
+
+# Sessions kept in each worker's in-memory LRU front
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 1024))
+
+PURGE_INTERVAL_SECONDS = 10 * 60
+
+# Attempts to merge a write into a session another request changed meanwhile
+SAVE_ATTEMPTS = 5
+
+# Superseded revisions still accepted from a cookie (a concurrent request's
+# response arrived last); any other revision is treated as no session
+REVISION_HISTORY = 8
+REVISION_LENGTH = 16
+
+
+_MISSING = object()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict whose contents live on the server, keyed by a random id"""
+
+    def __init__(self, initial=None, sid=None, revision=None, new=False, stale_cookie=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        # Token of the stored version this session was read from (None if new)
+        self.revision = revision
+        self.loaded = json.loads(json.dumps(dict(self), default=str))
+        self.new = new
+        self.stale_cookie = stale_cookie
+        self.replaced_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        """
+        Move the data to a new session id, dropping the old one when saved.
+        Called on login and logout so an id planted before either is useless.
+        """
+        if self.replaced_sid is None and not self.new:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.revision = None
+        self.loaded = {}
+        self.modified = True
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping of session id -> (revision, serialized data)"""
+
+    def __init__(self, max_size=SESSION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteSessionStore:
+    """Shared session tier: one row per session, visible to every worker"""
+
+    def __init__(self, db_path=SESSIONS_DB):
+        self.db_path = db_path
+        self._last_purge = 0.0
+        self._local = threading.local()
+        self.init_db()
+
+    def _connect(self):
+        """Per-thread connection, reused because the store is hit on every request"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+            # Losing the last few session writes on a power cut is acceptable;
+            # an fsync on every request is not
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                revision TEXT NOT NULL,
+                previous TEXT NOT NULL DEFAULT '',
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(sessions)')}
+        if 'previous' not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN previous TEXT NOT NULL DEFAULT ''")
+        conn.commit()
+
+    def load(self, sid):
+        """
+        Return (revision, serialized data, superseded revisions) or None if
+        missing or expired
+        """
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT revision, data, previous FROM sessions WHERE sid = ? AND expires_at > ?',
+            (sid, time.time())
+        ).fetchone()
+        return (str(row[0]), row[1], tuple(row[2].split())) if row else None
+
+    def save(self, sid, expected, revision, data, expires_at):
+        """
+        Write a new version if the stored one is still `expected` (None for a
+        new session); returns False if another request wrote first
+        """
+        conn = self._connect()
+        if expected is None:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO sessions (sid, revision, data, expires_at) VALUES (?, ?, ?, ?)',
+                (sid, revision, data, expires_at)
+            )
+        else:
+            # The replaced revision joins the (bounded) list of superseded ones
+            cursor = conn.execute(
+                "UPDATE sessions SET previous = substr(revision || ' ' || previous, 1, ?), "
+                'revision = ?, data = ?, expires_at = ? WHERE sid = ? AND revision = ?',
+                ((REVISION_LENGTH + 1) * REVISION_HISTORY - 1, revision, data, expires_at, sid, expected)
+            )
+        conn.commit()
+        self._maybe_purge()
+        return cursor.rowcount == 1
+
+    def delete(self, sid):
+        conn = self._connect()
+        conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+        conn.commit()
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        conn = self._connect()
+        conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+        conn.commit()
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Keeps session data on the server; the cookie only carries "<sid>.<revision>".
+
+    Every write stores a new random revision token, so a token always names
+    exactly one version of the data. Reads are served from a per-worker LRU
+    when the cached token matches the cookie, so most requests touch neither
+    SQLite nor any signing; other workers' cached copies miss and reload. A
+    cookie whose revision the store never issued for that id opens no
+    session.
+
+    Writes are compare-and-swap against the version the request read. When
+    concurrent requests on one session both change it (a retry, polling,
+    chat), the later one re-reads the stored version and reapplies its
+    changes on top: items appended to a list are appended to the stored
+    list, other changed keys overwrite the stored value.
+    """
+
+    def __init__(self, store=None, cache_size=SESSION_CACHE_SIZE):
+        self.store = store or SQLiteSessionStore()
+        self.cache = LRUCache(cache_size)
+
+    def _parse_cookie(self, value):
+        if not value or '.' not in value:
+            return None, None
+        sid, _, revision = value.rpartition('.')
+        if not sid or not revision:
+            return None, None
+        return sid, revision
+
+    def open_session(self, app, request):
+        sid, revision = self._parse_cookie(request.cookies.get(self.get_cookie_name(app)))
+        if sid is None:
+            return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+        cached = self.cache.get(sid)
+        if cached is None or cached[0] != revision:
+            stored = self.store.load(sid)
+            # A cookie naming an older version (a concurrent request's response
+            # arrived last) gets the current data and is re-issued on the way
+            # out; a revision never issued for this id gets nothing
+            if stored is None or (revision != stored[0] and revision not in stored[2]):
+                return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+            cached = stored[:2]
+            self.cache.put(sid, cached)
+
+        stored_revision, data = cached
+        return ServerSession(json.loads(data), sid=sid, revision=stored_revision,
+                             stale_cookie=stored_revision != revision)
+
+    def _merge(self, session, stored):
+        """Reapply the changes this request made onto another request's newer version"""
+        current = json.loads(json.dumps(dict(session), default=str))
+        merged = json.loads(stored)
+        for key, value in current.items():
+            loaded = session.loaded.get(key, _MISSING)
+            if loaded == value:
+                continue
+            theirs = merged.get(key)
+            if (isinstance(loaded, list) and isinstance(value, list) and isinstance(theirs, list)
+                    and value[:len(loaded)] == loaded):
+                # Only appended to (e.g. report_history): keep both requests' items
+                merged[key] = theirs + value[len(loaded):]
+            else:
+                merged[key] = value
+        for key in session.loaded:
+            if key not in current:
+                merged.pop(key, None)
+        return merged
+
+    def _write(self, session, lifetime):
+        """Store the session as a new version; returns its serialized data or None if it was deleted"""
+        data = json.dumps(dict(session), default=str)
+        expected = session.revision
+        for attempt in range(SAVE_ATTEMPTS):
+            revision = secrets.token_urlsafe(12)
+            if self.store.save(session.sid, expected, revision, data, time.time() + lifetime):
+                session.revision = revision
+                return data
+
+            stored = self.store.load(session.sid)
+            if stored is None:
+                # Cleared (e.g. logged out) by a concurrent request
+                return None
+            expected = stored[0]
+            data = json.dumps(self._merge(session, stored[1]), default=str)
+
+        raise RuntimeError(f'Session write kept conflicting after {SAVE_ATTEMPTS} attempts')
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+            self.cache.pop(session.replaced_sid)
+
+        if not session:
+            if (not session.new or session.replaced_sid is not None) and session.modified:
+                self.store.delete(session.sid)
+                self.cache.pop(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        if not session.modified and not session.stale_cookie:
+            return
+
+        expires = self.get_expiration_time(app, session)
+        if session.modified:
+            data = self._write(session, app.permanent_session_lifetime.total_seconds())
+            if data is None:
+                self.cache.pop(session.sid)
+                return
+            self.cache.put(session.sid, (session.revision, data))
+
+        response.set_cookie(
+            name,
+            f'{session.sid}.{session.revision}',
+            expires=expires,
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite
+        )
+
+    def stats(self):
+        return {
+            'backend': 'server',
+            'cached_sessions': len(self.cache),
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses
+        }
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from utils.concurrency import process_alive, run_blocking
+
+# Shared by every worker process on the host, so a retry that lands on another
+# worker still waits for the original request
+COALESCING_DB = os.environ.get('COALESCING_DB', 'coalescing.db')
+
+# A call still marked running after this long (its worker hung or was killed)
+# is ignored; callers waiting on another process give up and run it themselves
+COALESCING_LEASE_SECONDS = float(os.environ.get('COALESCING_LEASE_SECONDS', 120))
+
+# How long a finished call's result stays readable by the callers that were
+# already waiting on it (new callers never get it)
+COALESCING_RESULT_SECONDS = 30
+
+# Callers waiting on another process check after POLL seconds, doubling to MAX
+COALESCING_POLL_SECONDS = 0.05
+COALESCING_MAX_POLL_SECONDS = 0.5
+
+
+def flight_key(*parts):
+    """Stable hash of the parts that make two requests identical"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class FlightStore:
+    """Calls in flight across worker processes, shared through SQLite"""
+
+    def __init__(self, db_path=COALESCING_DB):
+        self.db_path = db_path
+        self._last_purge = 0.0
+        self.init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False, isolation_level=None)
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS flights (
+                token TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                result TEXT,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        # At most one running call per key; finished ones linger for their waiters
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_flights_running ON flights (name, key) "
+                     "WHERE status = 'running'")
+        conn.close()
+
+    def join_or_lead(self, name, key):
+        """(token, leader): a new running call to lead, or the running call of another process to wait on"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT token, pid, expires_at FROM flights WHERE name = ? AND key = ? AND status = 'running'",
+                (name, key)
+            ).fetchone()
+            if row is not None:
+                token, pid, expires_at = row
+                if expires_at > now and process_alive(pid):
+                    conn.execute('COMMIT')
+                    return token, False
+                conn.execute('DELETE FROM flights WHERE token = ?', (token,))
+
+            token = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO flights (token, name, key, status, pid, expires_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (token, name, key, 'running', os.getpid(), now + COALESCING_LEASE_SECONDS)
+            )
+            if now - self._last_purge > COALESCING_RESULT_SECONDS:
+                self._last_purge = now
+                conn.execute('DELETE FROM flights WHERE expires_at < ?', (now,))
+            conn.execute('COMMIT')
+            return token, True
+        finally:
+            conn.close()
+
+    def finish(self, token, result=None, failed=False):
+        """Publish the leader's result; a failure is published without one"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE flights SET status = ?, result = ?, expires_at = ? WHERE token = ?',
+                ('failed' if failed else 'done', None if failed else json.dumps(result, default=str),
+                 time.time() + COALESCING_RESULT_SECONDS, token)
+            )
+        finally:
+            conn.close()
+
+    def poll(self, token):
+        """(status, serialized result), or None if the call is gone"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT status, result, pid, expires_at FROM flights WHERE token = ?',
+                               (token,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        status, result, pid, expires_at = row
+        if status == 'running' and (expires_at < time.time() or not process_alive(pid)):
+            return None
+        return status, result
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FlightStore()
+        return _store
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: the first caller for a key runs the
+    function, callers arriving while it is still running wait for it and get
+    the same result (or the same exception). Nothing is cached afterwards; the
+    next call for the key runs again.
+
+    Within a process, waiting callers share the leader's result directly.
+    Across worker processes the running call is recorded in COALESCING_DB,
+    so a retry that lands on another worker waits for the original and gets
+    its result (which must be JSON-serializable) from there. A call that
+    fails, or whose process dies, is not shared across processes: the
+    waiting caller runs the function itself.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+        self.failed = 0
+        self.max_waiters = 0
+
+    def do(self, key, fn):
+        """Run fn() once per concurrent key; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._do_shared(key, fn)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key, fn):
+        """Run fn() unless another process is running the same call; wait for that one instead"""
+        store = _get_store()
+        token, leader = run_blocking(store.join_or_lead, self.name, key)
+        if not leader:
+            found = self._wait_remote(store, token)
+            if found is not None:
+                with self._lock:
+                    self.coalesced_remote += 1
+                return json.loads(found), True
+            token = None
+
+        with self._lock:
+            self.executed += 1
+        try:
+            result = fn()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            if token is not None:
+                run_blocking(store.finish, token, failed=True)
+            raise
+        if token is not None:
+            run_blocking(store.finish, token, result)
+        return result, False
+
+    def _wait_remote(self, store, token):
+        """The serialized result of another process's call, or None to run it here"""
+        deadline = time.monotonic() + COALESCING_LEASE_SECONDS
+        delay = COALESCING_POLL_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            state = run_blocking(store.poll, token)
+            if state is None or state[0] == 'failed':
+                return None
+            if state[0] == 'done':
+                return state[1]
+            delay = min(delay * 2, COALESCING_MAX_POLL_SECONDS)
+        return None
+
+    def stats(self):
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'coalesced_remote': self.coalesced_remote,
+            'failed': self.failed,
+            'in_flight': len(self._calls),
+            'max_waiters': self.max_waiters
+        }
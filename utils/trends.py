@@ -0,0 +1,52 @@
+def calculate_trends(results):
+    """Calculate health trends from multiple reports"""
+    if len(results) < 2:
+        return {'message': 'Need at least 2 reports for trend analysis'}
+    
+    trends = {}
+    
+    # Sort by timestamp
+    sorted_results = sorted(results, key=lambda x: x['timestamp'])
+    first = sorted_results[0]
+    latest = sorted_results[-1]
+    
+    # Hemoglobin trend
+    if first['values'].get('hemoglobin') and latest['values'].get('hemoglobin'):
+        hb_diff = latest['values']['hemoglobin'] - first['values']['hemoglobin']
+        trends['hemoglobin'] = {
+            'change': round(hb_diff, 1),
+            'direction': 'improving' if hb_diff > 0 else 'worsening' if hb_diff < 0 else 'stable',
+            'first': first['values']['hemoglobin'],
+            'latest': latest['values']['hemoglobin']
+        }
+    
+    # Blood sugar trend
+    if first['values'].get('blood_sugar') and latest['values'].get('blood_sugar'):
+        bs_diff = latest['values']['blood_sugar'] - first['values']['blood_sugar']
+        trends['blood_sugar'] = {
+            'change': round(bs_diff, 1),
+            'direction': 'worsening' if bs_diff > 0 else 'improving' if bs_diff < 0 else 'stable',
+            'first': first['values']['blood_sugar'],
+            'latest': latest['values']['blood_sugar']
+        }
+    
+    # Cholesterol trend
+    if first['values'].get('cholesterol') and latest['values'].get('cholesterol'):
+        chol_diff = latest['values']['cholesterol'] - first['values']['cholesterol']
+        trends['cholesterol'] = {
+            'change': round(chol_diff, 1),
+            'direction': 'worsening' if chol_diff > 0 else 'improving' if chol_diff < 0 else 'stable',
+            'first': first['values']['cholesterol'],
+            'latest': latest['values']['cholesterol']
+        }
+    
+    # Risk score trend
+    risk_diff = latest['risk_score'] - first['risk_score']
+    trends['overall'] = {
+        'change': risk_diff,
+        'direction': 'worsening' if risk_diff > 0 else 'improving' if risk_diff < 0 else 'stable',
+        'first_score': first['risk_score'],
+        'latest_score': latest['risk_score']
+    }
+    
+    return trends
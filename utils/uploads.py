@@ -0,0 +1,219 @@
+import codecs
+import hashlib
+import os
+import tempfile
+import uuid
+
+from werkzeug.utils import secure_filename
+
+# Bytes inspected before deciding whether an upload without a binary
+# signature is plain text
+TEXT_SNIFF_BYTES = 4096
+
+REPORT_KINDS = {'pdf', 'png', 'jpg', 'txt'}
+ARCHIVE_KINDS = {'zip'}
+
+MAGIC_NUMBERS = [
+    (b'%PDF-', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'PK\x03\x04', 'zip')
+]
+MAGIC_BYTES = max(len(magic) for magic, _ in MAGIC_NUMBERS)
+
+KIND_NAMES = {'pdf': 'PDF', 'png': 'PNG image', 'jpg': 'JPEG image', 'txt': 'text', 'zip': 'ZIP archive'}
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=415):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def sniff_magic(head):
+    for magic, kind in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def looks_like_text(head):
+    """UTF-8 without NUL bytes; a multi-byte character cut off at the end is fine"""
+    if b'\x00' in head:
+        return False
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def content_kind(data):
+    """Kind of a complete in-memory file from its leading bytes, or None if unrecognized"""
+    head = data[:TEXT_SNIFF_BYTES]
+    kind = sniff_magic(head)
+    if kind is None and head and looks_like_text(head):
+        kind = 'txt'
+    return kind
+
+
+class UploadStream:
+    """
+    Writable target for one multipart file part, filled as the body is parsed.
+
+    Chunks go straight to a temporary file next to the final upload location,
+    so nothing is buffered in memory. Along the way the content is hashed and
+    its type is sniffed from the leading bytes; once the type is known to be
+    outside `allowed_kinds` the upload is rejected: with `skip_rejected` the
+    rest of the part is discarded, otherwise UploadRejected is raised and
+    parsing of the request body stops there.
+    """
+
+    def __init__(self, directory, allowed_kinds, skip_rejected=False):
+        self.allowed_kinds = allowed_kinds
+        self.skip_rejected = skip_rejected
+        self.kind = None
+        self.rejected = None
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._head = b''
+        self._finished = False
+        self._persisted = False
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-', suffix='.part', delete=False)
+        self.path = self._file.name
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def _reject(self, message, status=415):
+        self.rejected = message
+        self._file.truncate(0)
+        if not self.skip_rejected:
+            self.close()
+            raise UploadRejected(message, status)
+
+    def _classify(self, final):
+        kind = sniff_magic(self._head)
+        if kind is None:
+            if 'txt' not in self.allowed_kinds:
+                if len(self._head) < MAGIC_BYTES and not final:
+                    return
+            elif len(self._head) < TEXT_SNIFF_BYTES and not final:
+                return
+            elif looks_like_text(self._head):
+                kind = 'txt'
+
+        if kind is None or kind not in self.allowed_kinds:
+            allowed = ', '.join(sorted(KIND_NAMES[k] for k in self.allowed_kinds))
+            found = KIND_NAMES[kind] if kind else 'unrecognized content'
+            self._reject(f'Invalid file type ({found}). Allowed: {allowed}.')
+            return
+
+        self.kind = kind
+        self._head = b''
+
+    def write(self, data):
+        if self.rejected:
+            return len(data)
+
+        self.size += len(data)
+        self._hash.update(data)
+        self._file.write(data)
+
+        if self.kind is None:
+            self._head += data[:TEXT_SNIFF_BYTES]
+            self._classify(final=False)
+        return len(data)
+
+    def _finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self.kind is None and not self.rejected:
+            if self.size == 0:
+                self._reject('Uploaded file is empty', status=400)
+            else:
+                self._classify(final=True)
+        self._file.flush()
+
+    def seek(self, offset, whence=0):
+        # The form parser rewinds the stream once the part is complete
+        self._finish()
+        return self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        self._finish()
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        self._finish()
+        return self._file.readline(size)
+
+    def tell(self):
+        return self._file.tell()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        self._file.flush()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def persist(self, filepath):
+        """Move the upload to filepath instead of copying it"""
+        self._finish()
+        self._file.close()
+        os.replace(self.path, filepath)
+        self._persisted = True
+        self.path = filepath
+
+    def close(self):
+        self._file.close()
+        if not self._persisted and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __iter__(self):
+        self._finish()
+        return iter(self._file)
+
+
+def save_upload(file, directory, prefix=None):
+    """
+    Store an upload under a unique name whose extension matches its sniffed
+    content; returns (filepath, filename). Raises UploadRejected if the upload
+    was rejected while it streamed in.
+    """
+    stream = file.stream
+    filename = secure_filename(file.filename) or 'upload'
+
+    if isinstance(stream, UploadStream):
+        stream.seek(0)
+        if stream.rejected:
+            raise UploadRejected(stream.rejected)
+        base, _ = os.path.splitext(filename)
+        filename = f'{base or "upload"}.{stream.kind}'
+
+    filepath = os.path.join(directory, f'{prefix or uuid.uuid4().hex}_{filename}')
+
+    if isinstance(stream, UploadStream):
+        stream.persist(filepath)
+    else:
+        file.save(filepath)
+    return filepath, filename
+
+
+def upload_sha256(file):
+    """Content hash computed while the upload streamed in, if available"""
+    stream = file.stream
+    return stream.sha256 if isinstance(stream, UploadStream) else None
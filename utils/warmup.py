@@ -0,0 +1,111 @@
+import io
+import os
+import tempfile
+import threading
+import time
+
+# Run the warm-up when a worker starts; with 0 the worker is ready at once
+WARMUP_ENABLED = os.environ.get('WARMUP', '1') == '1'
+
+SYNTHETIC_REPORT = """LAB REPORT
+Hemoglobin (Hb): 13.5 g/dL
+Fasting Blood Sugar: 98 mg/dL
+Total Cholesterol: 185 mg/dL
+ALT (SGPT): 28 U/L
+Creatinine: 0.9 mg/dL
+"""
+
+
+def synthetic_pdf_path():
+    """A one-page PDF in a temporary file (caller deletes it)"""
+    import PyPDF2
+
+    writer = PyPDF2.PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        writer.write(f)
+        return f.name
+
+
+def synthetic_image():
+    """A small image with a line of report text for OCR"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (320, 48), 'white')
+    ImageDraw.Draw(image).text((8, 16), 'Hemoglobin 13.5 g/dL', fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+class Warmup:
+    """
+    Runs registered warm-up steps once, in the background, and records how
+    long each took.
+
+    The worker only reports ready once every required step has succeeded; an
+    optional step (e.g. OCR on a host without Tesseract) is recorded as failed
+    without holding readiness back.
+    """
+
+    def __init__(self):
+        self._steps = []
+        self.stages = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def step(self, name, required=True):
+        """Decorator registering a warm-up step"""
+        def decorator(fn):
+            self._steps.append((name, fn, required))
+            self.stages[name] = {'status': 'pending', 'required': required}
+            return fn
+        return decorator
+
+    def run(self):
+        self.started_at = time.time()
+        for name, fn, required in self._steps:
+            self.stages[name]['status'] = 'running'
+            started = time.perf_counter()
+            try:
+                fn()
+                self.stages[name]['status'] = 'ok'
+            except Exception as e:
+                self.stages[name]['status'] = 'failed'
+                self.stages[name]['error'] = str(e)
+                print(f"Warm-up step {name} failed: {str(e)}")
+            self.stages[name]['seconds'] = round(time.perf_counter() - started, 4)
+        self.finished_at = time.time()
+
+    def start(self, enabled=WARMUP_ENABLED):
+        """Run the warm-up on a background thread (once per process)"""
+        if self._thread:
+            return
+        if not enabled:
+            for stage in self.stages.values():
+                stage['status'] = 'skipped'
+            self.started_at = self.finished_at = time.time()
+            return
+        self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def ready(self):
+        if self.finished_at is None:
+            return False
+        return all(stage['status'] in ('ok', 'skipped')
+                   for stage in self.stages.values() if stage['required'])
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'warming_up': self.started_at is not None and self.finished_at is None,
+            'total_seconds': round(self.finished_at - self.started_at, 4) if self.finished_at else None,
+            'stages': self.stages
+        }